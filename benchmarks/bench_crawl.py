@@ -0,0 +1,303 @@
+"""End-to-end crawl benchmark of TrustpilotSpider against the local fixture server.
+
+Starts benchmarks/fixture_server.py in a separate process, runs a full
+`trustpilot` crawl with the project settings against it and reports
+pages/sec, items/sec, CPU time and peak RSS of the crawler processes. Runs
+fully offline.
+
+With `--workers 1,2,4` the same crawl is repeated with that many worker
+processes cooperating over a shared queue (SHARED_QUEUE_URI), a SQLite
+file or benchmarks/redis_standin.py, and a scaling table is printed.
+
+example: python benchmarks/bench_crawl.py --categories 20 --subcategories 10 --latency 0.02
+example: python benchmarks/bench_crawl.py --replay fixtures/gb -s CONCURRENT_REQUESTS=32 --json bench.json
+example: python benchmarks/bench_crawl.py --latency 0.05 --workers 1,2,4 --shared-queue redis
+example: python benchmarks/bench_crawl.py --tls -s IMPERSONATE_POOL_SIZE=0
+example: python benchmarks/bench_crawl.py --missing-contacts 0.3 -s ENRICH_ENABLED=True
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trustpilot_scraper")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import add_server_arguments, make_site, serve  # noqa: E402
+import redis_standin  # noqa: E402
+
+# the crawl should be bound by the crawler, not by politeness settings
+BENCH_SETTINGS = {
+    "DOWNLOAD_DELAY": 0,
+    "AUTOTHROTTLE_ENABLED": False,
+    "CONCURRENT_REQUESTS": 16,
+    "CONCURRENT_REQUESTS_PER_DOMAIN": 16,
+    "TELNETCONSOLE_ENABLED": False,
+    "LOG_LEVEL": "WARNING",
+    # like company items, reviews are counted but not exported
+    "REVIEWS_FEED": "",
+}
+# workers stop this long after the shared queue ran dry, not counted in the report
+SHARED_QUEUE_IDLE_TIMEOUT = 1.0
+
+
+def wait_for_port(port, process, name):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    process.terminate()
+    raise SystemExit(f"{name} did not start on port {port}")
+
+
+def start_server(args):
+    site = make_site(args)
+    server = multiprocessing.Process(
+        target=serve,
+        args=(site,),
+        kwargs={"port": args.port, "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+                "etags": args.etags, "block_rate": args.block_rate, "tls": args.tls},
+        daemon=True,
+    )
+    server.start()
+    wait_for_port(args.port, server, "Fixture server")
+    return server, site
+
+
+def start_shared_queue(args, directory):
+    """Returns (SHARED_QUEUE_URI, stand-in process or None) for multi-worker runs."""
+    if args.shared_queue == "sqlite":
+        return f"sqlite:///{os.path.join(directory, 'queue.db')}", None
+    port = args.port + 1
+    standin = multiprocessing.Process(target=redis_standin.serve, kwargs={"port": port}, daemon=True)
+    standin.start()
+    wait_for_port(port, standin, "Redis stand-in")
+    return f"redis://127.0.0.1:{port}/0", standin
+
+
+def crawl(base_url, country, overrides):
+    """Runs the crawl in this process and returns (stats, active seconds, cpu seconds).
+
+    Active time runs from the start to the last response or item, which
+    leaves out a shared queue worker's idle wait before it stops.
+    """
+    os.chdir(PROJECT_DIR)
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ["SCRAPY_SETTINGS_MODULE"] = "trustpilot_scraper.settings"
+    # proxies would route the benchmark off the machine
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "PROXY_FILE", "PROXY_LIST"):
+        os.environ.pop(name, None)
+
+    from scrapy import signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    for name, value in {**BENCH_SETTINGS, **overrides}.items():
+        settings.set(name, value, priority="cmdline")
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler("trustpilot")
+    process.crawl(crawler, country=country, base_url=base_url)
+
+    last_activity = []
+    latencies = []
+
+    def active(**kwargs):
+        last_activity[:] = [time.perf_counter()]
+
+    def downloaded(request, **kwargs):
+        latencies.append(request.meta.get("download_latency", 0))
+
+    crawler.signals.connect(active, signal=signals.response_received)
+    crawler.signals.connect(downloaded, signal=signals.response_downloaded)
+    crawler.signals.connect(active, signal=signals.item_scraped)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    process.start()
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    elapsed = (last_activity[0] if last_activity else time.perf_counter()) - start
+    cpu = (end_usage.ru_utime - usage.ru_utime) + (end_usage.ru_stime - usage.ru_stime)
+    stats = dict(crawler.stats.get_stats(), download_latency_total=sum(latencies), downloads=len(latencies))
+    return stats, elapsed, cpu
+
+
+def run_worker(base_url, country, overrides, results):
+    stats, elapsed, cpu = crawl(base_url, country, overrides)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    results.put((stats, elapsed, cpu, peak_rss))
+
+
+def run(base_url, country, overrides, workers, shared_queue_uri=None):
+    """Runs one crawl with `workers` crawler processes and returns the summed stats, seconds, cpu and peak RSS."""
+    overrides = dict(overrides)
+    if workers > 1:
+        overrides.update({
+            "SHARED_QUEUE_URI": shared_queue_uri,
+            "SHARED_QUEUE_KEY": f"bench:{os.getpid()}:{workers}:{time.time_ns()}",
+            "SHARED_QUEUE_IDLE_TIMEOUT": SHARED_QUEUE_IDLE_TIMEOUT,
+            "SHARED_QUEUE_POLL_INTERVAL": 0.1,
+        })
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(base_url, country, overrides, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # read before joining, a child blocks on exit until its result is consumed
+    runs = []
+    while len(runs) < len(processes):
+        try:
+            runs.append(results.get(timeout=1))
+        except queue.Empty:
+            failed = [process for process in processes if process.exitcode not in (None, 0)]
+            # an exited worker's result would have been read by now
+            if failed or not any(process.is_alive() for process in processes):
+                for process in processes:
+                    process.terminate()
+                codes = ", ".join(str(process.exitcode) for process in failed) or "0"
+                sys.exit(f"{len(processes) - len(runs)} of {len(processes)} workers exited without a result "
+                         f"(exit code {codes})")
+    for process in processes:
+        process.join()
+
+    stats = {}
+    for run_stats, *_ in runs:
+        for key, value in run_stats.items():
+            if isinstance(value, (int, float)):
+                stats[key] = stats.get(key, 0) + value
+            else:
+                stats.setdefault(key, value)
+    elapsed = max(run[1] for run in runs)
+    cpu = sum(run[2] for run in runs)
+    peak_rss = max(run[3] for run in runs)
+    return stats, elapsed, cpu, peak_rss
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Invalid setting {pair!r}, expected NAME=VALUE")
+        overrides[name] = value
+    return overrides
+
+
+def report_for(stats, elapsed, cpu, peak_rss, workers, expected_items):
+    pages = stats.get("response_received_count", 0)
+    reviews = stats.get("reviews/items", 0)
+    items = stats.get("item_scraped_count", 0) - reviews
+    return {
+        "workers": workers,
+        "pages": pages,
+        "items": items,
+        "expected_items": expected_items,
+        "reviews": reviews,
+        "retries": stats.get("retry/count", 0),
+        "blocks_rescheduled": stats.get("blocks/rescheduled", 0),
+        "errors": stats.get("log_count/ERROR", 0),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "items_per_sec": round(items / elapsed, 1),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_utilization": round(cpu / elapsed, 3),
+        "peak_rss_mb": round(peak_rss / 2**20, 1),
+        "finish_reason": stats.get("finish_reason"),
+        "download_latency_ms": round(1000 * stats["download_latency_total"] / stats["downloads"], 2) if stats.get("downloads") else None,
+        "httpcache": {key.split("/", 1)[1]: value for key, value in stats.items() if key.startswith("httpcache/")},
+        "impersonate": {key.split("/", 1)[1]: value for key, value in stats.items() if key.startswith("impersonate/")},
+        "enrich": {key.split("/", 1)[1]: value for key, value in stats.items() if key.startswith("enrich/")},
+    }
+
+
+def print_report(report):
+    print(f"pages:       {report['pages']} in {report['seconds']:.2f}s ({report['pages_per_sec']:,.1f} pages/s)")
+    print(f"items:       {report['items']}/{report['expected_items']} ({report['items_per_sec']:,.1f} items/s)")
+    if report["reviews"]:
+        print(f"reviews:     {report['reviews']} ({report['reviews'] / report['seconds']:,.1f} reviews/s)")
+    print(f"retries:     {report['retries']}, block retries: {report['blocks_rescheduled']}, errors: {report['errors']}")
+    print(f"cpu:         {report['cpu_seconds']:.2f}s ({report['cpu_utilization']:.0%} of wall time)")
+    print(f"peak rss:    {report['peak_rss_mb']} MB" + (" per worker" if report["workers"] > 1 else ""))
+    if report["download_latency_ms"] is not None:
+        print(f"latency:     {report['download_latency_ms']:.2f} ms per download")
+    if report["impersonate"]:
+        counters = report["impersonate"]
+        print(f"impersonate: {', '.join(f'{key} {value}' for key, value in sorted(counters.items()))}")
+        if counters.get("connections_new"):
+            print(f"             {counters.get('requests', 0) / counters['connections_new']:.1f} pages per new connection")
+    if report["enrich"]:
+        print(f"enrich:      {', '.join(f'{key} {value}' for key, value in sorted(report['enrich'].items()))}")
+    if report["httpcache"]:
+        print(f"httpcache:   {', '.join(f'{key} {value}' for key, value in sorted(report['httpcache'].items()))}")
+
+
+def print_scaling(reports):
+    base = reports[0]["pages_per_sec"]
+    print(f"{'workers':>7}  {'seconds':>8}  {'pages/s':>9}  {'items/s':>9}  {'items':>11}  {'speedup':>7}")
+    for report in reports:
+        items = f"{report['items']}/{report['expected_items']}"
+        print(f"{report['workers']:>7}  {report['seconds']:>8.2f}  {report['pages_per_sec']:>9,.1f}  "
+              f"{report['items_per_sec']:>9,.1f}  {items:>11}  {report['pages_per_sec'] / base:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_server_arguments(parser)
+    parser.add_argument("--country", default="GB")
+    parser.add_argument("-s", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help="set/override a Scrapy setting for the benchmark crawl")
+    parser.add_argument("--workers", default="1", metavar="N[,N...]",
+                        help="crawler processes sharing one queue; a list runs the crawl once per count")
+    parser.add_argument("--shared-queue", choices=["sqlite", "redis"], default="sqlite",
+                        help="shared queue backend for multi-worker runs (redis needs the redis package)")
+    parser.add_argument("--json", metavar="FILE", help="also write the report as JSON, e.g. to compare runs in CI")
+    args = parser.parse_args()
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    overrides = parse_overrides(args.settings)
+    if args.tls:
+        # the fixture server's certificate is self-signed
+        overrides.setdefault("IMPERSONATE_VERIFY_TLS", False)
+
+    server, site = start_server(args)
+    standin = None
+    reports = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            shared_queue_uri = None
+            if max(worker_counts) > 1:
+                shared_queue_uri, standin = start_shared_queue(args, directory)
+            for workers in worker_counts:
+                scheme = "https" if args.tls else "http"
+                result = run(f"{scheme}://127.0.0.1:{args.port}", args.country, overrides, workers, shared_queue_uri)
+                reports.append(report_for(*result, workers, site.expected_items))
+    finally:
+        server.terminate()
+        if standin is not None:
+            standin.terminate()
+
+    if len(reports) == 1:
+        print_report(reports[0])
+    else:
+        print_scaling(reports)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports[0] if len(reports) == 1 else reports, f, indent=2)
+    sys.exit(0 if all(report["items"] == site.expected_items for report in reports) else 1)
+
+
+if __name__ == "__main__":
+    main()
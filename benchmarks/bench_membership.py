@@ -0,0 +1,81 @@
+"""Compares memory use and lookup speed of the dedup membership backends.
+
+example: python benchmarks/bench_membership.py --sizes 1000000 10000000
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "trustpilot_scraper"))
+
+from trustpilot_scraper.membership import ExactSet, ScalableBloomFilter, SortedHashSet  # noqa: E402
+
+
+def make_urls(n, offset=0):
+    return (f"https://www.trustpilot.com/review/company-{i}.example.com" for i in range(offset, offset + n))
+
+
+def build(factory, size):
+    backend = factory(size)
+    for url in make_urls(size):
+        backend.add(url)
+    return backend
+
+
+def bench(name, factory, size, lookups):
+    # memory is measured on a separate build, tracemalloc slows inserts down a lot
+    gc.collect()
+    tracemalloc.start()
+    backend = build(factory, size)
+    # the peak includes temporary copies, e.g. while SortedHashSet merges its buffer
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del backend
+    gc.collect()
+
+    start = time.perf_counter()
+    backend = build(factory, size)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for url in make_urls(lookups):
+        assert url in backend
+    hit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    false_positives = sum(url in backend for url in make_urls(lookups, offset=size))
+    miss_time = time.perf_counter() - start
+
+    print(
+        f"{name:>8} {size:>10,} | {memory / 2**20:>9.1f} MiB | peak {peak / 2**20:>9.1f} MiB"
+        f" | {memory / size:>6.1f} B/url"
+        f" | insert {size / insert_time:>10,.0f}/s"
+        f" | hit {lookups / hit_time:>10,.0f}/s | miss {lookups / miss_time:>10,.0f}/s"
+        f" | fp {false_positives / lookups:.5f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    parser.add_argument("--backends", nargs="+", default=["set", "bloom", "hashes"])
+    args = parser.parse_args()
+
+    factories = {
+        "set": lambda size: ExactSet(),
+        "bloom": lambda size: ScalableBloomFilter(initial_capacity=size // 4, error_rate=args.error_rate),
+        "hashes": lambda size: SortedHashSet(),
+    }
+    for size in args.sizes:
+        for name in args.backends:
+            bench(name, factories[name], size, min(args.lookups, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Micro-benchmark of TrustpilotSpider.parse_company_profile.
+
+Runs the current parser and the previous selector-based one over the same
+pages, checks that both produce identical items and reports profiles/sec.
+
+By default the profile pages saved in benchmarks/profiles are parsed.
+
+example: python benchmarks/bench_parse_profile.py --fixtures fixtures/gb/profiles
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "trustpilot_scraper"))
+
+from scrapy.http import HtmlResponse, Request  # noqa: E402
+
+from fixtures import profile_page  # noqa: E402
+from trustpilot_scraper.items import TrustpilotScraperItem  # noqa: E402
+from trustpilot_scraper.spiders.trustpilot import TrustpilotSpider  # noqa: E402
+
+PROFILES_DIR = Path(__file__).parent / "profiles"
+
+
+def legacy_parse_company_profile(spider, response):
+    """parse_company_profile as it was before the precompiled XPaths."""
+    item = TrustpilotScraperItem()
+    item['company_name'] = response.xpath('//h1//span[contains(@class, "title_displayName")]/text()').get().strip()
+    item['category'] = response.meta.get('category_name')
+    item['subcategory'] = response.meta.get('subcategory')
+
+    avg = response.xpath('//p[contains(@class, "trustScore")]/text()').get()
+    item['avg_review_score'] = avg.strip() if avg else None
+    item['review_count'] = response.xpath('//span[contains(@class, "reviewsAndRating")]/text()').getall()[-1].replace(',', '').strip()
+
+    website = phone = email = address = None
+    for li in response.xpath('//ul[contains(@class, "itemsColumn")]/li'):
+        hrefs = li.xpath('.//a/@href').getall()
+        if hrefs:
+            for href in hrefs:
+                if not href:
+                    continue
+                href = href.strip()
+                if href.startswith('mailto:') and not email:
+                    email = href.split(':', 1)[1].split('?')[0].strip()
+                elif href.startswith('tel:') and not phone:
+                    phone = href.split(':', 1)[1].strip()
+                else:
+                    link = response.urljoin(href)
+                    if 'trustpilot.com' in link:
+                        continue
+                    if not website:
+                        website = link.split('?')[0].strip()
+        else:
+            paragraph = li.xpath('.//p/text()').get()
+            if paragraph:
+                address = paragraph.strip()
+
+    item['website'] = website
+    item['phone'] = phone
+    item['email'] = email
+    item['address'] = address
+    item['trustpilot_url'] = response.url
+    item['country'] = spider.country_code
+    yield item
+
+
+def load_pages(fixtures, count):
+    """Returns (url, body) pairs from saved HTML files, or `count` synthetic pages without fixtures."""
+    if fixtures:
+        return [
+            (f"https://www.trustpilot.com/review/{path.stem}", path.read_bytes())
+            for path in sorted(Path(fixtures).glob("*.html"))
+        ]
+    return [
+        (f"https://www.trustpilot.com/review/company-{i}.example.com", profile_page(f"company-{i}.example.com").encode())
+        for i in range(count)
+    ]
+
+
+def make_responses(pages):
+    # a fresh response per run, parsel caches the parsed tree on the response
+    meta = {"category_name": "bench", "subcategory": "bench_sub"}
+    return [
+        HtmlResponse(url=url, body=body, encoding="utf-8", request=Request(url, meta=meta))
+        for url, body in pages
+    ]
+
+
+def run(parse, spider, pages, rounds):
+    items = []
+    elapsed = 0.0
+    for _ in range(rounds):
+        responses = make_responses(pages)
+        start = time.perf_counter()
+        items = [dict(item) for response in responses for item in parse(response)]
+        elapsed += time.perf_counter() - start
+    return items, len(pages) * rounds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=str(PROFILES_DIR), help="directory of saved profile pages (*.html)")
+    parser.add_argument("--synthetic", type=int, metavar="COUNT", help="parse COUNT generated pages instead of saved ones")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    spider = TrustpilotSpider(country="GB")
+    pages = load_pages(None if args.synthetic else args.fixtures, args.synthetic)
+
+    legacy_items, legacy_rate = run(lambda r: legacy_parse_company_profile(spider, r), spider, pages, args.rounds)
+    items, rate = run(spider.parse_company_profile, spider, pages, args.rounds)
+
+    mismatches = sum(a != b for a, b in zip(legacy_items, items))
+    print(f"pages:   {len(pages)} x {args.rounds} rounds")
+    print(f"before:  {legacy_rate:,.0f} profiles/s")
+    print(f"after:   {rate:,.0f} profiles/s ({rate / legacy_rate:.2f}x)")
+    print(f"output:  {'identical' if not mismatches else f'{mismatches} mismatching items'}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
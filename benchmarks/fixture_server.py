@@ -0,0 +1,244 @@
+"""Local stand-in for trustpilot.com serving synthetic or recorded pages.
+
+Synthetic mode builds a category tree from fixtures.py: `--categories` x
+`--subcategories` listings of `--pages` pages with `--companies` profiles
+each, linked with rel="next" like the real site, and profiles with pages of
+reviews. With `--missing-contacts` some profiles lack email and phone and
+link to a company website served under *.localhost. Replay mode serves the
+pages recorded with FIXTURE_RECORD_DIR. Both modes can add latency, inject
+503 errors and block pages (429s and 200 captcha pages) and send ETags,
+answering If-None-Match with 304. With `--tls` pages are served over HTTPS
+with a throwaway self-signed certificate.
+
+example: python benchmarks/fixture_server.py --categories 20 --subcategories 10 --latency 0.05
+example: python benchmarks/fixture_server.py --replay fixtures/gb --error-rate 0.02
+         scrapy crawl trustpilot -a base_url=http://127.0.0.1:8765
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import ssl
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fixtures import categories_page, company_site_page, listing_page, profile_page  # noqa: E402
+
+CAPTCHA_PAGE = b"""<html><head><title>Just a moment...</title></head>
+<body><div id="challenge-platform"><div class="g-recaptcha"></div></div></body></html>"""
+
+
+class SyntheticSite:
+    """Synthetic category tree: every subcategory has the same number of pages and companies.
+
+    A `missing_contacts` share of the profiles has no email and phone; their
+    website is served by this server under <domain>.localhost, which curl
+    resolves to the loopback address.
+    """
+
+    def __init__(self, categories=3, subcategories=3, pages=3, companies=5, missing_contacts=0.0, base_url=None):
+        self.categories = categories
+        self.subcategories = subcategories
+        self.pages = pages
+        self.companies = companies
+        self.missing_contacts = missing_contacts
+        self.base_url = urlparse(base_url or "http://127.0.0.1:8765")
+
+    @property
+    def expected_items(self):
+        return self.categories * self.subcategories * self.pages * self.companies
+
+    def website(self, domain):
+        """Website of a company without contacts on its profile, None for the others."""
+        if zlib.crc32(domain.encode()) % 1000 >= self.missing_contacts * 1000:
+            return None
+        # underscores are not valid in host names
+        return f"{self.base_url.scheme}://{domain.replace('_', '-')}.localhost:{self.base_url.port}/"
+
+    def page(self, url, host=""):
+        """Returns (content type, body) for a parsed request URL, or None for unknown paths."""
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        country = query.get("country", ["GB"])[0]
+        hostname = host.rsplit(":", 1)[0]
+        if hostname.endswith(".localhost"):
+            body = company_site_page(hostname.removesuffix(".localhost"), path)
+            if body is None:
+                return None
+        elif path == "/categories":
+            body = categories_page(self.categories, self.subcategories, country)
+        elif path.startswith("/categories/"):
+            page = int(query.get("page", ["1"])[0])
+            if page > self.pages:
+                return None
+            body = listing_page(path.split("/")[2], page, self.pages, self.companies, country)
+        elif path.startswith("/review/"):
+            domain = path.split("/")[2]
+            website = self.website(domain)
+            body = profile_page(domain, page=int(query.get("page", ["1"])[0]), website=website, contacts=website is None)
+            if body is None:
+                return None
+        else:
+            return None
+        return "text/html; charset=utf-8", body.encode("utf-8")
+
+
+class RecordedSite:
+    """Pages recorded by FixtureRecorderMiddleware, looked up by path and query string."""
+
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+        with open(os.path.join(fixture_dir, "index.json")) as f:
+            self.index = json.load(f)
+        # fall back to the path alone, the country parameter may differ between runs
+        self.by_path = {}
+        for key, entry in self.index.items():
+            self.by_path.setdefault(key.split("?")[0], entry)
+        self.expected_items = sum(entry["file"].startswith("profiles/") for entry in self.by_path.values())
+
+    def page(self, url, host=""):
+        path = url.path.rstrip("/")
+        entry = self.index.get(f"{path}?{url.query}" if url.query else path) or self.by_path.get(path)
+        if entry is None:
+            return None
+        with open(os.path.join(self.fixture_dir, entry["file"]), "rb") as f:
+            return entry["content_type"], f.read()
+
+
+def make_handler(site, latency=0.0, jitter=0.0, error_rate=0.0, etags=False, block_rate=0.0):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if latency or jitter:
+                time.sleep(latency + random.uniform(0, jitter))
+            if error_rate and random.random() < error_rate:
+                return self.send_body(503, "text/plain", b"Service Unavailable")
+            if block_rate and random.random() < block_rate:
+                if random.random() < 0.5:
+                    return self.send_body(429, "text/plain", b"Too Many Requests")
+                return self.send_body(200, "text/html; charset=utf-8", CAPTCHA_PAGE)
+
+            page = site.page(urlparse(self.path), self.headers.get("Host", ""))
+            if page is None:
+                return self.send_body(404, "text/plain", b"Not Found")
+            if not etags:
+                return self.send_body(200, *page)
+
+            etag = f'"{hashlib.sha1(page[1]).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self.send_body(304, page[0], b"", etag)
+            self.send_body(200, *page, etag)
+
+        def send_body(self, status, content_type, body, etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FixtureHandler
+
+
+def self_signed_context():
+    """Server SSL context with a fresh self-signed certificate for 127.0.0.1."""
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=7))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_file, "wb") as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+def make_site(args):
+    if args.replay:
+        return RecordedSite(args.replay)
+    base_url = f"{'https' if args.tls else 'http'}://127.0.0.1:{args.port}"
+    return SyntheticSite(args.categories, args.subcategories, args.pages, args.companies, args.missing_contacts, base_url)
+
+
+def serve(site, host="127.0.0.1", port=8765, latency=0.0, jitter=0.0, error_rate=0.0, etags=False, block_rate=0.0,
+          tls=False):
+    server = ThreadingHTTPServer((host, port), make_handler(site, latency, jitter, error_rate, etags, block_rate))
+    server.daemon_threads = True
+    if tls:
+        # handshakes happen in the handler threads, not in accept()
+        server.socket = self_signed_context().wrap_socket(server.socket, server_side=True,
+                                                          do_handshake_on_connect=False)
+    server.serve_forever()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--replay", metavar="DIR", help="serve pages recorded with FIXTURE_RECORD_DIR")
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--subcategories", type=int, default=5, help="subcategories per category")
+    parser.add_argument("--pages", type=int, default=3, help="listing pages per subcategory")
+    parser.add_argument("--companies", type=int, default=20, help="companies per listing page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--block-rate", type=float, default=0.0,
+                        help="share of requests answered with a 429 or a captcha page")
+    parser.add_argument("--missing-contacts", type=float, default=0.0,
+                        help="share of profiles without email and phone, with a website served under *.localhost")
+    parser.add_argument("--etags", action="store_true", help="send ETags and answer If-None-Match with 304")
+    parser.add_argument("--tls", action="store_true", help="serve HTTPS with a self-signed certificate")
+    parser.add_argument("--port", type=int, default=8765)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    site = make_site(args)
+    scheme = "https" if args.tls else "http"
+    print(f"Serving {site.expected_items} companies on {scheme}://127.0.0.1:{args.port}")
+    try:
+        serve(site, port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+              etags=args.etags, block_rate=args.block_rate, tls=args.tls)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
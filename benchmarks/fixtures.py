@@ -0,0 +1,119 @@
+"""Synthetic Trustpilot-like pages matching the XPaths used by TrustpilotSpider."""
+
+import json
+import random
+import zlib
+from datetime import datetime, timedelta, timezone
+
+
+def categories_page(num_categories, subcategories_per_category, country="GB"):
+    cards = []
+    for c in range(num_categories):
+        links = "".join(
+            f'<li><a href="/categories/cat{c}_sub{s}">Subcategory {c}.{s}</a></li>'
+            for s in range(subcategories_per_category)
+        )
+        cards.append(f'<div class="styles_card CDS_Card_abc"><h2>Category {c} &amp; Co, Ltd</h2><ul>{links}</ul></div>')
+    return f"<html><body><main>{''.join(cards)}</main></body></html>"
+
+
+def listing_page(subcategory, page, num_pages, companies_per_page, country="GB"):
+    links = "".join(
+        f'<a href="/review/{subcategory}-p{page}-c{i}.example.com" class="link_card">Company {i}</a>'
+        for i in range(companies_per_page)
+    )
+    next_link = ""
+    if page < num_pages:
+        next_link = f'<a rel="next" href="/categories/{subcategory}?page={page + 1}&amp;country={country}">Next</a>'
+    # Next.js page data, as embedded in the real listings
+    next_data = json.dumps({"props": {"pageProps": {"businessUnits": {
+        "totalPages": num_pages,
+        "businesses": [
+            {"identifyingName": f"{subcategory}-p{page}-c{i}.example.com", "displayName": f"Company {i}"}
+            for i in range(companies_per_page)
+        ],
+    }}}})
+    return (f"<html><body><section>{links}</section><nav>{next_link}</nav>"
+            f'<script id="__NEXT_DATA__" type="application/json">{next_data}</script></body></html>')
+
+
+# reviews per review page, as on the real site
+REVIEWS_PER_PAGE = 20
+# newest review of every synthetic company, older ones follow every few hours
+NEWEST_REVIEW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def review_cards(domain, page, total):
+    """(review dicts as in the embedded JSON, <article> cards) for one review page."""
+    reviews, cards = [], []
+    for index in range((page - 1) * REVIEWS_PER_PAGE, min(page * REVIEWS_PER_PAGE, total)):
+        published = (NEWEST_REVIEW - timedelta(hours=6 * index)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        rating = index % 5 + 1
+        reply = {"message": f"Thanks for review {index}", "publishedDate": published} if index % 3 == 0 else None
+        reviews.append({
+            "id": f"{domain}-r{index}", "rating": rating, "title": f"Review {index}",
+            "text": f"Review text {index} for {domain}", "consumer": {"displayName": f"Consumer {index}"},
+            "dates": {"publishedDate": published, "experiencedDate": published[:10] + "T00:00:00.000Z"},
+            "reply": reply,
+        })
+        reply_html = ""
+        if reply:
+            reply_html = (f'<div><time datetime="{published}"></time>'
+                          f'<p data-service-review-business-reply-text-typography="true">{reply["message"]}</p></div>')
+        cards.append(
+            f'<article data-service-review-card-paper="true"><span data-consumer-name-typography="true">Consumer {index}</span>'
+            f'<time datetime="{published}"></time><div data-service-review-rating="{rating}"></div>'
+            f'<a href="/reviews/{domain}-r{index}" data-review-title-typography="true"><h2>Review {index}</h2></a>'
+            f'<p data-service-review-text-typography="true">Review text {index} for {domain}</p>{reply_html}</article>'
+        )
+    return reviews, "".join(cards)
+
+
+def profile_page(domain, seed=None, page=1, website=None, contacts=True):
+    """Company profile; page 1 is the profile itself and every page carries one page of reviews.
+
+    Without `contacts` the contact block only has the website and address.
+    """
+    rnd = random.Random(seed if seed is not None else domain)
+    reviews = rnd.randint(1, 50000)
+    total_pages = -(-reviews // REVIEWS_PER_PAGE)
+    if page > total_pages:
+        return None
+    review_data, cards = review_cards(domain, page, reviews)
+    next_link = ""
+    if page < total_pages:
+        next_link = f'<a name="pagination-button-next" rel="next" href="/review/{domain}?page={page + 1}">Next</a>'
+    # drawn in page order whether or not the contacts are shown, so the other fields stay the same
+    trust_score = rnd.randint(10, 50) / 10
+    phone = f"+44 20 7946 {rnd.randint(1000, 9999)}"
+    contact_links = ""
+    if contacts:
+        contact_links = (f'<li><a href="mailto:info@{domain}?subject=hi">info@{domain}</a></li>\n'
+                         f'<li><a href="tel:{phone}">Phone</a></li>\n')
+    next_data = json.dumps({"props": {"pageProps": {
+        "reviews": review_data,
+        "filters": {"pagination": {"currentPage": page, "totalPages": total_pages}},
+    }}})
+    return f"""<html><head><title>{domain}</title></head><body>
+<header><h1 class="title_title"><span class="title_displayName__x">  Company {domain}  </span></h1>
+<span class="styles_reviewsAndRating__x">Reviews</span><span class="styles_reviewsAndRating__x">{reviews:,}</span>
+<p class="trustScore_x">{trust_score}</p></header>
+<section><ul class="styles_itemsColumn__x">
+<li><a href="{website or f'https://{domain}/'}?utm_source=trustpilot">{domain}</a></li>
+{contact_links}<li><p>{rnd.randint(1, 200)} High Street, London</p></li>
+</ul></section><section>{cards}</section><nav>{next_link}</nav>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script></body></html>"""
+
+
+def company_site_page(domain, path):
+    """Pages of a company's own website: the phone on the home page, emails on /contact and /impressum."""
+    number = zlib.crc32(domain.encode()) % 9000 + 1000
+    if path == "":
+        body = f'<h1>{domain}</h1><p>Call us on +44 20 7946 {number}</p><a href="/contact">Contact</a>'
+    elif path == "/contact":
+        body = f'<p>Write to <a href="mailto:hello@{domain}">hello@{domain}</a></p><img src="/img/team@2x.png">'
+    elif path == "/impressum":
+        body = f"<p>{domain} GmbH, E-Mail: legal@{domain}</p>"
+    else:
+        return None
+    return f"<html><body>{body}</body></html>"
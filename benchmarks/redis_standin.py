@@ -0,0 +1,227 @@
+"""Minimal Redis-compatible server for running shared queue crawls on one machine.
+
+Speaks RESP2 and RESP3 and implements the commands RedisSharedQueue and
+redis-py's connection setup use (HELLO, PING, SELECT, CLIENT, ZADD,
+ZPOPMAX, ZCARD, SADD, SCARD, DEL, FLUSHDB, FLUSHALL), keeping everything
+in memory. Not a general-purpose Redis replacement.
+
+example: python benchmarks/redis_standin.py --port 6390
+         scrapy crawl trustpilot -s SHARED_QUEUE_URI=redis://127.0.0.1:6390/0
+"""
+
+import argparse
+import asyncio
+import bisect
+import heapq
+
+
+class SortedSet:
+    """Members grouped by score; within a score ordered by their bytes, like Redis."""
+
+    def __init__(self):
+        self.scores = {}
+        self.buckets = {}
+        # max-heap of scores with lazy deletion
+        self.heap = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def add(self, member, score):
+        old = self.scores.get(member)
+        if old == score:
+            return 0
+        if old is not None:
+            self.discard(member)
+        self.scores[member] = score
+        bucket = self.buckets.get(score)
+        if bucket is None:
+            bucket = self.buckets[score] = []
+            heapq.heappush(self.heap, -score)
+        bisect.insort(bucket, member)
+        return 0 if old is not None else 1
+
+    def discard(self, member):
+        score = self.scores.pop(member)
+        bucket = self.buckets[score]
+        bucket.pop(bisect.bisect_left(bucket, member))
+        if not bucket:
+            del self.buckets[score]
+
+    def pop_max(self):
+        while self.heap:
+            score = -self.heap[0]
+            bucket = self.buckets.get(score)
+            if bucket:
+                member = bucket.pop()
+                del self.scores[member]
+                if not bucket:
+                    del self.buckets[score]
+                    heapq.heappop(self.heap)
+                return member, score
+            heapq.heappop(self.heap)
+        return None
+
+
+class Error(Exception):
+    pass
+
+
+class Database:
+    def __init__(self):
+        self.keys = {}
+
+    def typed(self, key, cls):
+        value = self.keys.get(key)
+        if value is None:
+            value = self.keys[key] = cls()
+        elif not isinstance(value, cls):
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def cleanup(self, key):
+        if not self.keys.get(key):
+            self.keys.pop(key, None)
+
+    def execute(self, name, args, resp3=False):
+        if name == b"ZADD":
+            zset = self.typed(args[0], SortedSet)
+            pairs = args[1:]
+            if not pairs or len(pairs) % 2:
+                raise Error("ERR syntax error")
+            return sum(zset.add(member, float(score)) for score, member in zip(pairs[::2], pairs[1::2]))
+        if name == b"ZPOPMAX":
+            zset = self.typed(args[0], SortedSet)
+            count = int(args[1]) if len(args) > 1 else 1
+            result = []
+            for _ in range(count):
+                popped = zset.pop_max()
+                if popped is None:
+                    break
+                result.append(list(popped))
+            self.cleanup(args[0])
+            # RESP2 replies with a flat list, RESP3 nests the pairs when a count is given
+            if resp3 and len(args) > 1:
+                return result
+            return [value for pair in result for value in pair]
+        if name == b"ZCARD":
+            return len(self.typed(args[0], SortedSet))
+        if name == b"SADD":
+            members = self.typed(args[0], set)
+            added = len(set(args[1:]) - members)
+            members.update(args[1:])
+            return added
+        if name == b"SCARD":
+            return len(self.typed(args[0], set))
+        if name == b"DEL":
+            return sum(self.keys.pop(key, None) is not None for key in args)
+        raise Error(f"ERR unknown command '{name.decode()}'")
+
+
+def encode(value, resp3=False):
+    if isinstance(value, Error):
+        return f"-{value}\r\n".encode()
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, float):
+        text = repr(value).removesuffix(".0").encode()
+        return b",%s\r\n" % text if resp3 else encode(text)
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, dict):
+        if resp3:
+            return b"%%%d\r\n" % len(value) + b"".join(
+                encode(k, resp3) + encode(v, resp3) for k, v in value.items()
+            )
+        value = [item for pair in value.items() for item in pair]
+    return b"*%d\r\n" % len(value) + b"".join(encode(item, resp3) for item in value)
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # inline command, e.g. from telnet
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+class StandinServer:
+    def __init__(self, databases=16):
+        self.databases = [Database() for _ in range(databases)]
+
+    async def handle(self, reader, writer):
+        db = self.databases[0]
+        resp3 = False
+        try:
+            while (args := await read_command(reader)) is not None:
+                if not args:
+                    continue
+                name = args[0].upper()
+                if name == b"QUIT":
+                    writer.write(encode("OK", resp3))
+                    break
+                if name == b"HELLO":
+                    if len(args) > 1:
+                        resp3 = args[1] == b"3"
+                    reply = {"server": "redis", "version": "7.2.0", "proto": 3 if resp3 else 2,
+                             "id": id(writer), "mode": "standalone", "role": "master", "modules": []}
+                elif name == b"PING":
+                    reply = args[1] if len(args) > 1 else "PONG"
+                elif name == b"SELECT":
+                    db = self.databases[int(args[1])]
+                    reply = "OK"
+                elif name == b"CLIENT":
+                    reply = "OK"
+                elif name in (b"FLUSHDB", b"FLUSHALL"):
+                    for database in ([db] if name == b"FLUSHDB" else self.databases):
+                        database.keys.clear()
+                    reply = "OK"
+                else:
+                    try:
+                        reply = db.execute(name, args[1:], resp3)
+                    except Error as e:
+                        reply = e
+                    except (IndexError, ValueError):
+                        reply = Error(f"ERR wrong arguments for '{name.decode().lower()}' command")
+                writer.write(encode(reply, resp3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve_async(host, port):
+    server = await asyncio.start_server(StandinServer().handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def serve(host="127.0.0.1", port=6390):
+    asyncio.run(serve_async(host, port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+
+    print(f"Serving a Redis stand-in on redis://127.0.0.1:{args.port}/0")
+    try:
+        serve(port=args.port)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
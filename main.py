@@ -1,6 +1,191 @@
+"""Multi-country crawl orchestrator.
+
+Fans countries out over a process pool, one `trustpilot` crawl per country,
+or with --shards N one crawl per country shard. Each crawl runs in a fresh
+process with its own settings, proxy slice, feed shard and log file; stats
+are aggregated and the shards of a country are merged when all crawls are done.
+
+example: python main.py --countries GB DE FR NL --workers 4 --output-dir output
+example: python main.py --countries GB DE --proxy-file proxies.txt -s CONCURRENT_REQUESTS=8
+example: python main.py --countries US --shards 8 --workers 8
+example: python main.py --countries GB DE FR --format parquet
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent / "trustpilot_scraper"
+
+
+def load_proxies(proxy_file=None):
+    """Reads proxies the same way ProxyMiddleware does: PROXY_FILE plus PROXY_LIST."""
+    proxies = []
+    proxy_file = proxy_file or os.getenv("PROXY_FILE")
+    if proxy_file and os.path.exists(proxy_file):
+        with open(proxy_file, 'r') as f:
+            proxies = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    proxy_list_env = os.getenv("PROXY_LIST")
+    if proxy_list_env:
+        proxies.extend(p.strip() for p in proxy_list_env.split(',') if p.strip())
+    return proxies
+
+
+def crawl_country(country, output_dir, feed_format, proxies, overrides, shard=None):
+    """Runs one crawl in the current (worker) process and returns its stats."""
+    os.chdir(PROJECT_DIR)
+    sys.path.insert(0, str(PROJECT_DIR))
+    os.environ["SCRAPY_SETTINGS_MODULE"] = "trustpilot_scraper.settings"
+
+    # the worker only sees its own proxy slice
+    os.environ.pop("PROXY_FILE", None)
+    if proxies:
+        os.environ["PROXY_LIST"] = ",".join(proxies)
+    else:
+        os.environ.pop("PROXY_LIST", None)
+
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    crawl_name = shard_name(country, shard)
+    settings = get_project_settings()
+    if feed_format == "parquet":
+        # every worker writes its own part files into the shared partitioned dataset
+        settings.set("PARQUET_DIR", str(output_dir / "parquet"), priority="cmdline")
+    else:
+        settings.set("FEEDS", {str(output_dir / f"{crawl_name}.{feed_format}"): {"format": feed_format}}, priority="cmdline")
+    settings.set("REVIEWS_FEED", str(output_dir / f"{crawl_name}_reviews.jsonl"), priority="cmdline")
+    settings.set("LOG_FILE", str(output_dir / f"{crawl_name}.log"), priority="cmdline")
+    for name, value in overrides.items():
+        settings.set(name, value, priority="cmdline")
+
+    spider_args = {"country": country}
+    if shard:
+        spider_args["shard"] = f"{shard[0]}/{shard[1]}"
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler("trustpilot")
+    process.crawl(crawler, **spider_args)
+    process.start()
+    return crawler.stats.get_stats()
+
+
+def shard_name(country, shard=None):
+    return f"{country}-{shard[0]}of{shard[1]}" if shard else country
+
+
+def merge_shards(country, shards, output_dir, feed_format):
+    """Merges the feeds of a country's shards into <country>.<format>."""
+    sys.path.insert(0, str(PROJECT_DIR))
+    from trustpilot_scraper.commands.merge import merge_feeds
+
+    paths = [output_dir / f"{shard_name(country, (k, shards))}.{feed_format}" for k in range(shards)]
+    output = output_dir / f"{country}.{feed_format}"
+    written, total = merge_feeds([str(p) for p in paths if p.exists()], str(output))
+    print(f"[{country}] merged {shards} shards: {total} items, {written} companies -> {output}")
+
+
+def aggregate_stats(stats_by_crawl):
+    """Sums numeric stats over all crawls."""
+    totals = {}
+    for stats in stats_by_crawl.values():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[key] = totals.get(key, 0) + value
+    return dict(sorted(totals.items()))
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"Invalid setting {pair!r}, expected NAME=VALUE")
+        overrides[name] = value
+    return overrides
+
+
 def main():
-    print("Hello from trustpilotscraper!")
+    parser = argparse.ArgumentParser(description="Crawl several countries in parallel.")
+    parser.add_argument("--countries", nargs="+", required=True, help="country codes, e.g. GB DE FR")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of crawler processes")
+    parser.add_argument("--output-dir", default="output", help="directory for feed shards, logs and stats")
+    parser.add_argument("--format", default="jsonl", help="feed format of each shard (jsonl, json or csv), or parquet for one partitioned dataset")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="split every country into N crawls by subcategory, merged afterwards")
+    parser.add_argument("--proxy-file", help="proxy list split between workers (defaults to PROXY_FILE)")
+    parser.add_argument("-s", dest="settings", action="append", default=[], metavar="NAME=VALUE",
+                        help="set/override a Scrapy setting in every worker")
+    args = parser.parse_args()
+
+    countries = [c.upper() for c in args.countries]
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    shards = [(k, args.shards) for k in range(args.shards)] if args.shards > 1 else [None]
+    crawls = [(country, shard) for country in countries for shard in shards]
+    workers = max(1, min(args.workers, len(crawls)))
+    output_dir = Path(args.output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    proxies = load_proxies(args.proxy_file)
+    if proxies and len(proxies) < workers:
+        # a worker with an empty slice would crawl from this host's IP
+        parser.error(f"{len(proxies)} proxies for {workers} workers, every worker needs at least one: "
+                     f"lower --workers or add proxies")
+    overrides = parse_overrides(args.settings)
+
+    # Twisted's reactor cannot be restarted, so every crawl gets a fresh process
+    context = multiprocessing.get_context("spawn")
+    stats_by_crawl = {}
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1) as pool:
+        # every worker slot owns a disjoint proxy slice and a crawl is only
+        # submitted when a slot is free, so concurrent crawls never share proxies
+        free_slots = list(range(workers))
+        pending = deque(crawls)
+        running = {}
+        while pending or running:
+            while pending and free_slots:
+                slot = free_slots.pop(0)
+                country, shard = pending.popleft()
+                future = pool.submit(crawl_country, country, output_dir, args.format,
+                                     proxies[slot::workers], overrides, shard)
+                running[future] = (shard_name(country, shard), slot)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, slot = running.pop(future)
+                free_slots.append(slot)
+                try:
+                    stats_by_crawl[name] = future.result()
+                except Exception as e:
+                    failed.append(name)
+                    print(f"[{name}] crawl failed: {e}")
+                    continue
+                stats = stats_by_crawl[name]
+                print(f"[{name}] {stats.get('item_scraped_count', 0)} items, "
+                      f"{stats.get('response_received_count', 0)} responses, "
+                      f"finish reason: {stats.get('finish_reason')}")
+
+    if args.shards > 1 and args.format != "parquet":
+        for country in countries:
+            merge_shards(country, args.shards, output_dir, args.format)
+
+    totals = aggregate_stats(stats_by_crawl)
+    summary = {"crawls": sorted(stats_by_crawl), "failed": sorted(failed), "totals": totals}
+    with open(output_dir / "stats.json", "w") as f:
+        json.dump(summary, f, indent=2, default=str)
+
+    print("------- SWEEP SUMMARY -------")
+    print(f"Crawls finished: {len(stats_by_crawl)}/{len(crawls)}")
+    print(f"Total items scraped: {totals.get('item_scraped_count', 0)}")
+    print(f"Total responses: {totals.get('response_received_count', 0)}")
+    print(f"Stats written to {output_dir / 'stats.json'}")
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""ResponseClassifier with the project's block detection settings."""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "trustpilot_scraper"))
+
+from scrapy.http import HtmlResponse, Response  # noqa: E402
+from scrapy.settings import Settings  # noqa: E402
+
+from trustpilot_scraper import blocks, settings  # noqa: E402
+
+PROFILES_DIR = os.path.join(ROOT, "benchmarks", "profiles")
+PROFILE_URL = "https://www.trustpilot.com/review/example.com"
+CATEGORY_URL = "https://www.trustpilot.com/categories/bank?country=GB"
+
+PROFILE_BODY = (
+    '<html><body><h1><span class="typography_title_displayName__x">Example</span></h1>'
+    "<p>Quick delivery, no captcha at checkout.</p></body></html>"
+)
+CAPTCHA_BODY = (
+    '<html><head><script src="https://ct.captcha-delivery.com/c.js"></script></head>'
+    "<body>Please enable JS and disable any ad blocker</body></html>"
+)
+BLOCK_BODY = "<html><head><title>Access Denied</title></head><body>You don't have permission.</body></html>"
+# a 200 page without the profile heading, e.g. an empty shell or an interstitial
+SOFT_BLOCK_BODY = "<html><head><title>Trustpilot</title></head><body><div id='__next'></div></body></html>"
+
+
+def response(url, body, status=200):
+    return HtmlResponse(url, status=status, body=body.encode(), encoding="utf-8")
+
+
+class ResponseClassifierTest(unittest.TestCase):
+    def setUp(self):
+        project_settings = Settings()
+        project_settings.setmodule(settings)
+        self.classifier = blocks.ResponseClassifier.from_settings(project_settings)
+
+    def test_real_profile_is_ok(self):
+        # the page mentions "captcha", but has the profile heading
+        self.assertEqual(self.classifier.classify(response(PROFILE_URL, PROFILE_BODY)), blocks.OK)
+
+    def test_saved_profile_pages_are_ok(self):
+        names = sorted(name for name in os.listdir(PROFILES_DIR) if name.endswith(".html"))
+        self.assertTrue(names, f"no profile pages in {PROFILES_DIR}")
+        for name in names:
+            with self.subTest(name=name), open(os.path.join(PROFILES_DIR, name), encoding="utf-8") as f:
+                page = response(f"https://www.trustpilot.com/review/{name[:-len('.html')]}", f.read())
+                self.assertEqual(self.classifier.classify(page), blocks.OK)
+
+    def test_block_status(self):
+        for status in (403, 429):
+            with self.subTest(status=status):
+                self.assertEqual(self.classifier.classify(response(PROFILE_URL, PROFILE_BODY, status)), blocks.BLOCKED)
+
+    def test_not_found(self):
+        for status in (404, 410):
+            with self.subTest(status=status):
+                self.assertEqual(self.classifier.classify(response(PROFILE_URL, "", status)), blocks.NOT_FOUND)
+
+    def test_captcha(self):
+        for url in (PROFILE_URL, CATEGORY_URL):
+            with self.subTest(url=url):
+                self.assertEqual(self.classifier.classify(response(url, CAPTCHA_BODY)), blocks.CAPTCHA)
+
+    def test_block_marker(self):
+        for url in (PROFILE_URL, CATEGORY_URL):
+            with self.subTest(url=url):
+                self.assertEqual(self.classifier.classify(response(url, BLOCK_BODY)), blocks.BLOCKED)
+
+    def test_soft_block(self):
+        self.assertEqual(self.classifier.classify(response(PROFILE_URL, SOFT_BLOCK_BODY)), blocks.BLOCKED)
+        # category pages have no required marker
+        self.assertEqual(self.classifier.classify(response(CATEGORY_URL, SOFT_BLOCK_BODY)), blocks.OK)
+        # a retried server error is not a soft block
+        self.assertEqual(self.classifier.classify(response(PROFILE_URL, SOFT_BLOCK_BODY, 503)), blocks.OK)
+
+    def test_markers_after_scanned_bytes(self):
+        body = "<html><body>" + " " * blocks.ResponseClassifier.SCAN_BYTES + "access denied</body></html>"
+        self.assertEqual(self.classifier.classify(response(CATEGORY_URL, body)), blocks.OK)
+
+    def test_binary_response(self):
+        image = Response("https://www.trustpilot.com/review/logo.png", body=b"\x89PNG captcha-delivery")
+        self.assertEqual(self.classifier.classify(image), blocks.OK)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Company URL canonicalization and CompanyDedupSpiderMiddleware."""
+
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "trustpilot_scraper"))
+
+from scrapy import Request  # noqa: E402
+
+from trustpilot_scraper.items import CompanyListingsItem, TrustpilotScraperItem  # noqa: E402
+from trustpilot_scraper.middlewares import CompanyDedupSpiderMiddleware  # noqa: E402
+from trustpilot_scraper.storage import SeenUrlStore  # noqa: E402
+from trustpilot_scraper.utils import normalize_company_url  # noqa: E402
+
+CANONICAL = "https://www.trustpilot.com/review/example.com"
+
+
+class NormalizeCompanyUrlTest(unittest.TestCase):
+    def test_locale_hosts(self):
+        for host in ("www.trustpilot.com", "de.trustpilot.com", "uk.trustpilot.com", "fr.trustpilot.com",
+                     "trustpilot.com", "WWW.Trustpilot.COM"):
+            with self.subTest(host=host):
+                self.assertEqual(normalize_company_url(f"https://{host}/review/example.com"), CANONICAL)
+
+    def test_case(self):
+        self.assertEqual(normalize_company_url("https://www.trustpilot.com/review/Example.COM"), CANONICAL)
+        self.assertEqual(normalize_company_url("HTTPS://DE.TRUSTPILOT.COM/review/EXAMPLE.com"), CANONICAL)
+
+    def test_trailing_path_query_and_fragment(self):
+        for url in (
+            "https://www.trustpilot.com/review/example.com/",
+            "https://www.trustpilot.com/review/example.com?page=2",
+            "https://www.trustpilot.com/review/example.com/?languages=all&stars=5",
+            "https://www.trustpilot.com/review/example.com#reviews",
+            "https://www.trustpilot.com/review/example.com/reviews/abc123",
+            "  https://de.trustpilot.com/review/example.com/  ",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(normalize_company_url(url), CANONICAL)
+
+    def test_subdomain_companies_stay_apart(self):
+        self.assertEqual(normalize_company_url("https://uk.trustpilot.com/review/shop.example.com"),
+                         "https://www.trustpilot.com/review/shop.example.com")
+        self.assertNotEqual(normalize_company_url("https://www.trustpilot.com/review/shop.example.com"), CANONICAL)
+
+    def test_other_hosts_and_empty(self):
+        # fixture server crawls keep their host
+        self.assertEqual(normalize_company_url("http://127.0.0.1:8000/review/Example.com/"),
+                         "http://127.0.0.1:8000/review/example.com")
+        self.assertIsNone(normalize_company_url(None))
+        self.assertIsNone(normalize_company_url(""))
+
+
+class CompanyDedupTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "companies_seen.db")
+        self.middleware = self.open()
+
+    def open(self, max_age=3600):
+        stats = SimpleNamespace(values={})
+        stats.inc_value = lambda key: stats.values.__setitem__(key, stats.values.get(key, 0) + 1)
+        middleware = CompanyDedupSpiderMiddleware(SeenUrlStore(self.path), max_age, stats)
+        self.addCleanup(middleware.store.close)
+        return middleware
+
+    def listing(self, subcategory, url="https://de.trustpilot.com/review/Example.com/"):
+        return Request(url, meta={"category_name": "shopping", "subcategory": subcategory})
+
+    def test_duplicates_are_filtered_and_listings_collected(self):
+        first = self.middleware.process(self.listing("fashion"))
+        self.assertEqual(first.url, CANONICAL)
+        self.assertIsNone(self.middleware.process(self.listing("shoes")))
+        item = self.middleware.process(TrustpilotScraperItem(trustpilot_url=CANONICAL))
+        self.assertEqual(item["listed_in"], ["shopping/fashion", "shopping/shoes"])
+        self.assertEqual(self.middleware.stats.values, {"dedup/filtered_requests": 1})
+
+    def test_listing_after_the_item(self):
+        self.middleware.process(self.listing("fashion"))
+        self.middleware.process(TrustpilotScraperItem(trustpilot_url=CANONICAL))
+        late = self.middleware.process(self.listing("shoes"))
+        self.assertIsInstance(late, CompanyListingsItem)
+        self.assertEqual(dict(late), {"trustpilot_url": CANONICAL, "listed_in": ["shopping/fashion", "shopping/shoes"]})
+        # a listing that was already recorded yields nothing
+        self.assertIsNone(self.middleware.process(self.listing("shoes")))
+
+    def test_persistent_entries_expire(self):
+        self.middleware.process(self.listing("fashion"))
+        self.middleware.process(TrustpilotScraperItem(trustpilot_url=CANONICAL))
+
+        # a later crawl within the max age still skips the company
+        self.assertIsNone(self.open().process(self.listing("fashion")))
+
+        # once the entries are older than the max age, it is crawled again
+        self.middleware.store.conn.execute("UPDATE seen_urls SET seen_at = seen_at - 7200, emitted_at = emitted_at - 7200")
+        self.middleware.store.conn.execute("UPDATE memberships SET seen_at = seen_at - 7200")
+        later = self.open()
+        self.assertEqual(later.process(self.listing("shoes")).url, CANONICAL)
+        item = later.process(TrustpilotScraperItem(trustpilot_url=CANONICAL))
+        self.assertEqual(item["listed_in"], ["shopping/shoes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+"""parse_company_profile against the selector-based parser it replaced, on the saved profile pages."""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_parse_profile import PROFILES_DIR, legacy_parse_company_profile, load_pages, make_responses  # noqa: E402
+from trustpilot_scraper.spiders.trustpilot import TrustpilotSpider  # noqa: E402
+
+
+class ParseProfileParityTest(unittest.TestCase):
+    def setUp(self):
+        self.spider = TrustpilotSpider(country="GB")
+        self.pages = load_pages(str(PROFILES_DIR), 0)
+
+    def test_same_items_as_legacy_parser(self):
+        self.assertTrue(self.pages, f"no profile pages in {PROFILES_DIR}")
+        for (url, _), legacy, response in zip(self.pages, make_responses(self.pages), make_responses(self.pages)):
+            with self.subTest(url=url):
+                expected = [dict(item) for item in legacy_parse_company_profile(self.spider, legacy)]
+                self.assertEqual([dict(item) for item in self.spider.parse_company_profile(response)], expected)
+
+    def test_contacts_from_every_column(self):
+        pages = [page for page in self.pages if page[0].endswith("/layout-split-contacts.example.co.uk")]
+        item = next(self.spider.parse_company_profile(make_responses(pages)[0]))
+        self.assertEqual(item["email"], "service@layout-split-contacts.example.co.uk")
+        self.assertEqual(item["phone"], "+44 20 7946 0035")
+        self.assertEqual(item["address"], "1 Example Street, London, EC1A 1BB, United Kingdom")
+        # the TrustScore is in the sidebar, outside the header around the h1
+        self.assertEqual(item["avg_review_score"], "4.6")
+        self.assertEqual(item["review_count"], "48213")
+
+
+if __name__ == "__main__":
+    unittest.main()
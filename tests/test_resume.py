@@ -0,0 +1,190 @@
+"""Kills a JOBDIR crawl of the fixture server with SIGKILL and resumes it.
+
+Both runs are `scrapy` subprocesses in a temporary directory, so the
+crawl's own state files (discovery cache, fingerprints) start empty. The
+bookkeeping of in-flight rows in SqliteRequestQueue is checked directly.
+"""
+
+import json
+import os
+import re
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(ROOT, "trustpilot_scraper")
+sys.path.insert(0, PROJECT_DIR)
+
+from scrapy import Request, Spider, signals  # noqa: E402
+from scrapy.signalmanager import SignalManager  # noqa: E402
+
+from trustpilot_scraper.scheduler import SqliteRequestQueue  # noqa: E402
+from trustpilot_scraper.signals import checkpoint  # noqa: E402
+FIXTURE_SERVER = os.path.join(ROOT, "benchmarks", "fixture_server.py")
+
+# 2 listings of 6 companies; with one request at a time and the latency
+# below, a profile arrives every 0.3s while checkpoints run every 0.1s
+SITE = ["--categories", "1", "--subcategories", "2", "--pages", "1", "--companies", "6"]
+EXPECTED_ITEMS = 12
+CRAWL_SETTINGS = {
+    "CONCURRENT_REQUESTS": 1,
+    "DOWNLOAD_DELAY": 0,
+    "AUTOTHROTTLE_ENABLED": False,
+    "TELNETCONSOLE_ENABLED": False,
+    "CHECKPOINT_INTERVAL": 0.1,
+    "LOG_LEVEL": "DEBUG",
+}
+CRAWLED_PROFILE_RE = re.compile(r"Crawled \(200\) <GET (\S+/review/[^\s>]+)>")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"fixture server did not start on port {port}")
+
+
+def read(path):
+    if not os.path.exists(path):
+        return ""
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+class KillAndResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.port = free_port()
+        self.server = subprocess.Popen(
+            [sys.executable, FIXTURE_SERVER, *SITE, "--latency", "0.3", "--port", str(self.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.kill)
+        wait_for_port(self.port)
+
+        self.env = dict(os.environ, SCRAPY_SETTINGS_MODULE="trustpilot_scraper.settings",
+                        PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_DIR, os.environ.get("PYTHONPATH")])))
+        # proxies would send the crawl off the machine
+        for name in ("HTTP_PROXY", "HTTPS_PROXY", "PROXY_FILE", "PROXY_LIST"):
+            self.env.pop(name, None)
+        self.jobdir = os.path.join(self.tmp.name, "job")
+        self.feed = os.path.join(self.tmp.name, "items.jsonl")
+
+    def scrapy(self, args, log_file):
+        settings = []
+        for name, value in {**CRAWL_SETTINGS, "LOG_FILE": log_file}.items():
+            settings += ["-s", f"{name}={value}"]
+        return subprocess.Popen([sys.executable, "-m", "scrapy", *args, *settings],
+                                cwd=self.tmp.name, env=self.env)
+
+    def kill_after_checkpoint(self, process, log_file, min_items=4, timeout=60):
+        """SIGKILLs the crawl once `min_items` items are scraped and all of them were checkpointed."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.assertIsNone(process.poll(), "the crawl finished before it could be killed")
+            scraped = read(log_file).count("Scraped from")
+            # feeds are only flushed by a checkpoint
+            if scraped >= min_items and read(self.feed).count("\n") == scraped:
+                # let the checkpoint finish saving the crawl state
+                time.sleep(0.05)
+                if read(log_file).count("Scraped from") == scraped:
+                    process.send_signal(signal.SIGKILL)
+                    process.wait()
+                    return scraped
+            time.sleep(0.01)
+        process.kill()
+        self.fail("no checkpoint after the first items")
+
+    def test_resume_after_sigkill(self):
+        first_log = os.path.join(self.tmp.name, "first.log")
+        first = self.scrapy(["crawl", "trustpilot", "-a", f"base_url=http://127.0.0.1:{self.port}",
+                             "-s", f"JOBDIR={self.jobdir}", "-o", self.feed], first_log)
+        killed_at = self.kill_after_checkpoint(first, first_log)
+        self.assertLess(killed_at, EXPECTED_ITEMS)
+
+        resume_log = os.path.join(self.tmp.name, "resume.log")
+        resume = self.scrapy(["resume", self.jobdir], resume_log)
+        self.assertEqual(resume.wait(timeout=120), 0)
+
+        urls = [json.loads(line)["trustpilot_url"] for line in read(self.feed).splitlines()]
+        self.assertEqual(len(set(urls)), EXPECTED_ITEMS)
+        self.assertEqual(len(urls), EXPECTED_ITEMS, "duplicate items after resuming")
+
+        profiles = CRAWLED_PROFILE_RE.findall(read(first_log) + read(resume_log))
+        refetched = sorted({url for url in profiles if profiles.count(url) > 1})
+        self.assertEqual(refetched, [], "profiles fetched again after resuming")
+        self.assertNotIn("Checkpoint to", read(first_log) + read(resume_log))
+
+
+class SqliteRequestQueueTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "requests.sqlite")
+        # the queue only uses the crawler's signals and spider
+        self.crawler = SimpleNamespace(signals=SignalManager(), spider=Spider("test"))
+
+    def open(self):
+        return SqliteRequestQueue(self.crawler, self.path)
+
+    def rows(self):
+        with sqlite3.connect(self.path) as conn:
+            return conn.execute("SELECT id, in_flight FROM requests ORDER BY id").fetchall()
+
+    def test_in_flight_rows_follow_the_request_meta(self):
+        queue = self.open()
+        for n in range(3):
+            queue.push(Request(f"http://example.com/{n}", priority=n))
+        first, second, _ = queue.pop(), queue.pop(), queue.pop()
+        self.assertEqual((first.url, first.meta["queue_row"]), ("http://example.com/2", 3))
+        self.assertEqual(self.rows(), [(1, 1), (2, 1), (3, 1)])
+
+        # a copy of the popped request finishes its row too
+        self.crawler.signals.send_catch_log(signals.request_dropped, request=first.replace(url="http://example.com/x"))
+        # a retry gets a row of its own
+        queue.push(second.replace(dont_filter=True))
+        self.assertEqual(queue.pop().meta["queue_row"], 4)
+        self.assertEqual(second.meta["queue_row"], 2)
+
+        # finished rows are deleted at the second checkpoint
+        self.crawler.signals.send_catch_log(checkpoint)
+        self.assertEqual(len(self.rows()), 4)
+        self.crawler.signals.send_catch_log(checkpoint)
+        self.assertEqual(self.rows(), [(1, 1), (2, 1), (4, 1)])
+
+    def test_close_removes_requests_that_never_reached_the_downloader(self):
+        queue = self.open()
+        queue.push(Request("http://example.com/ignored"))
+        queue.push(Request("http://example.com/pending"))
+        self.assertEqual(queue.pop().url, "http://example.com/pending")
+        queue.close()
+        self.assertEqual(self.rows(), [(1, 0)])
+
+        # a killed crawl queues its in-flight requests again
+        queue = self.open()
+        self.assertEqual(queue.pop().url, "http://example.com/ignored")
+        queue.conn.close()
+        self.assertEqual(len(self.open()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+"""Shared queue backends: ordering, seen fingerprints and several workers popping one queue."""
+
+import importlib.util
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "trustpilot_scraper"))
+
+from trustpilot_scraper.sharedqueue import MemorySharedQueue, open_shared_queue  # noqa: E402
+
+REDIS_STANDIN = os.path.join(ROOT, "benchmarks", "redis_standin.py")
+WORKERS = 4
+REQUESTS = 2000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def drain(uri, key, start, results):
+    """Worker process: pops until the queue is empty and reports what it got."""
+    queue = open_shared_queue(uri, key)
+    new_seen = [n for n in range(REQUESTS) if queue.add_seen(f"fp{n}")]
+    start.wait()
+    popped = []
+    while (data := queue.pop()) is not None:
+        popped.append(data)
+    queue.close()
+    results.put((popped, new_seen))
+
+
+class SharedQueueTests:
+    """Cases every backend has to pass; subclasses open the backend."""
+
+    def open(self, key="test"):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.key = f"test:{self.id()}:{time.time_ns()}"
+        self.queue = self.open(self.key)
+        self.addCleanup(self.queue.close)
+
+    def test_pop_empty(self):
+        self.assertIsNone(self.queue.pop())
+        self.assertEqual(len(self.queue), 0)
+
+    def test_highest_priority_first_lifo_within(self):
+        for priority, data in [(0, b"a"), (10, b"b"), (0, b"c"), (-5, b"d"), (10, b"e")]:
+            self.queue.push(priority, data)
+        self.assertEqual(len(self.queue), 5)
+        self.assertEqual([self.queue.pop() for _ in range(6)], [b"e", b"b", b"c", b"a", b"d", None])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_equal_requests_are_kept(self):
+        self.queue.push(1, b"same")
+        self.queue.push(1, b"same")
+        self.assertEqual([self.queue.pop(), self.queue.pop(), self.queue.pop()], [b"same", b"same", None])
+
+    def test_add_seen(self):
+        self.assertTrue(self.queue.add_seen("fp1"))
+        self.assertFalse(self.queue.add_seen("fp1"))
+        self.assertTrue(self.queue.add_seen("fp2"))
+        self.assertEqual(self.queue.seen_count(), 2)
+
+    def test_keys_are_separate_queues(self):
+        other = self.open(f"{self.key}:other")
+        self.addCleanup(other.close)
+        self.queue.push(0, b"mine")
+        self.queue.add_seen("fp")
+        self.assertIsNone(other.pop())
+        self.assertTrue(other.add_seen("fp"))
+        self.assertEqual(self.queue.pop(), b"mine")
+
+    def test_shared_between_workers(self):
+        second = self.open(self.key)
+        self.addCleanup(second.close)
+        self.queue.push(0, b"a")
+        self.queue.push(0, b"b")
+        self.assertTrue(self.queue.add_seen("fp"))
+        self.assertFalse(second.add_seen("fp"))
+        self.assertEqual(len(second), 2)
+        self.assertEqual({second.pop(), self.queue.pop()}, {b"a", b"b"})
+        self.assertIsNone(second.pop())
+
+
+class ProcessWorkersTests(SharedQueueTests):
+    """Worker processes popping one queue concurrently."""
+
+    uri = None
+
+    def test_no_request_handed_to_two_workers(self):
+        pushed = {f"request-{n}".encode() for n in range(REQUESTS)}
+        for n, data in enumerate(sorted(pushed)):
+            self.queue.push(n % 7, data)
+
+        context = multiprocessing.get_context("spawn")
+        start = context.Event()
+        results = context.Queue()
+        workers = [context.Process(target=drain, args=(self.uri, self.key, start, results)) for _ in range(WORKERS)]
+        for worker in workers:
+            worker.start()
+        start.set()
+        # read before joining, a worker blocks on exit until its result is consumed
+        runs = [results.get(timeout=60) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        popped = [data for worker_popped, _ in runs for data in worker_popped]
+        self.assertEqual(len(popped), len(set(popped)), "a request was popped by two workers")
+        self.assertEqual(set(popped), pushed)
+        # every fingerprint is new to exactly one worker
+        seen = sorted(n for _, new_seen in runs for n in new_seen)
+        self.assertEqual(seen, list(range(REQUESTS)))
+        self.assertEqual(len(self.queue), 0)
+
+
+class MemorySharedQueueTest(SharedQueueTests, unittest.TestCase):
+    def open(self, key="test"):
+        return MemorySharedQueue(key)
+
+    def test_no_request_handed_to_two_workers(self):
+        # crawlers sharing a memory queue run in one process, so the workers take turns
+        workers = [self.queue] + [self.open(self.key) for _ in range(WORKERS - 1)]
+        pushed = {f"request-{n}".encode() for n in range(REQUESTS)}
+        for n, data in enumerate(sorted(pushed)):
+            workers[n % WORKERS].push(n % 7, data)
+        popped = []
+        while (data := workers[len(popped) % WORKERS].pop()) is not None:
+            popped.append(data)
+        self.assertEqual(len(popped), len(set(popped)))
+        self.assertEqual(set(popped), pushed)
+
+
+class SqliteSharedQueueTest(ProcessWorkersTests, unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.uri = f"sqlite:///{os.path.join(cls.tmp.name, 'queue.db')}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def open(self, key="test"):
+        return open_shared_queue(self.uri, key)
+
+
+@unittest.skipUnless(importlib.util.find_spec("redis"), "needs the redis package")
+class RedisSharedQueueTest(ProcessWorkersTests, unittest.TestCase):
+    """Runs against benchmarks/redis_standin.py."""
+
+    @classmethod
+    def setUpClass(cls):
+        port = free_port()
+        cls.standin = subprocess.Popen([sys.executable, REDIS_STANDIN, "--port", str(port)],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        cls.uri = f"redis://127.0.0.1:{port}/0"
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    cls.standin.kill()
+                    raise
+                time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.kill()
+        cls.standin.wait()
+
+    def open(self, key="test"):
+        return open_shared_queue(self.uri, key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+# Add-ons adjust the settings before the crawler is built
+#
+# See: https://docs.scrapy.org/en/latest/topics/addons.html
+
+COMPANY_ITEM = "trustpilot_scraper.items.TrustpilotScraperItem"
+LISTINGS_ITEM = "trustpilot_scraper.items.CompanyListingsItem"
+REVIEW_ITEM = "trustpilot_scraper.items.ReviewItem"
+
+
+class ReviewFeedsAddon:
+    """Sends reviews to their own feed when REVIEWS_ENABLED is set.
+
+    Feeds that do not name item classes (e.g. those from `-o`) are limited
+    to company items (and their late listings) and REVIEWS_FEED is added for ReviewItem, so profiles
+    and reviews never end up in the same file.
+    """
+
+    def update_settings(self, settings):
+        if not settings.getbool("REVIEWS_ENABLED"):
+            return
+        priority = settings.getpriority("FEEDS") or "addon"
+        feeds = {}
+        for uri, options in settings.getdict("FEEDS").items():
+            options = dict(options)
+            options.setdefault("item_classes", [COMPANY_ITEM, LISTINGS_ITEM])
+            feeds[uri] = options
+        if settings.get("REVIEWS_FEED"):
+            feeds[settings.get("REVIEWS_FEED")] = {
+                "format": settings.get("REVIEWS_FEED_FORMAT"),
+                "item_classes": [REVIEW_ITEM],
+            }
+        settings.set("FEEDS", feeds, priority=priority)
@@ -0,0 +1,63 @@
+# Response classification for BlockDetectionMiddleware and the HTTP cache policy
+
+from scrapy.http import TextResponse
+
+from trustpilot_scraper.utils import url_kind
+
+OK = "ok"
+BLOCKED = "blocked"
+CAPTCHA = "captcha"
+NOT_FOUND = "not_found"
+
+
+class ResponseClassifier:
+    """Tells real pages from ban, captcha and not-found responses.
+
+    A response is blocked when its status is one of BLOCK_HTTP_CODES, when
+    it contains one of BLOCK_MARKERS, or when it is a 200 page of a type
+    listed in BLOCK_REQUIRED_MARKERS (e.g. a profile) that lacks the
+    element every real page of that type has, which catches soft blocks
+    served with 200. Pages that do have their required marker are never
+    classified by body markers, so a real profile mentioning "captcha"
+    is still ok.
+    """
+
+    # markers are searched in the start of the body only
+    SCAN_BYTES = 256 * 1024
+
+    def __init__(self, block_codes=(), block_markers=(), captcha_markers=(), required_markers=None):
+        self.block_codes = set(block_codes)
+        self.block_markers = [marker.lower().encode() for marker in block_markers]
+        self.captcha_markers = [marker.lower().encode() for marker in captcha_markers]
+        self.required_markers = {kind: marker.encode() for kind, marker in (required_markers or {}).items()}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            [int(code) for code in settings.getlist("BLOCK_HTTP_CODES")],
+            settings.getlist("BLOCK_MARKERS"),
+            settings.getlist("CAPTCHA_MARKERS"),
+            settings.getdict("BLOCK_REQUIRED_MARKERS"),
+        )
+
+    def classify(self, response):
+        if response.status in (404, 410):
+            return NOT_FOUND
+        if response.status in self.block_codes:
+            return BLOCKED
+        if not isinstance(response, TextResponse):
+            return OK
+
+        head = response.body[:self.SCAN_BYTES]
+        required = self.required_markers.get(url_kind(response.url))
+        if required and required in head:
+            return OK
+
+        head = head.lower()
+        if any(marker in head for marker in self.captcha_markers):
+            return CAPTCHA
+        if any(marker in head for marker in self.block_markers):
+            return BLOCKED
+        if required and response.status == 200:
+            return BLOCKED
+        return OK
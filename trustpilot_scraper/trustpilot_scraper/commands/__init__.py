@@ -0,0 +1 @@
+# Custom scrapy commands, see COMMANDS_MODULE in settings.py
@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.exporters import CsvItemExporter, JsonItemExporter, JsonLinesItemExporter
+
+from trustpilot_scraper.utils import normalize_company_url
+
+EXPORTERS = {
+    "jsonl": JsonLinesItemExporter,
+    "jsonlines": JsonLinesItemExporter,
+    "json": JsonItemExporter,
+    "csv": CsvItemExporter,
+}
+
+
+def feed_format(path):
+    fmt = os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in EXPORTERS:
+        raise UsageError(f"Unsupported feed format of {path}, expected one of: {', '.join(EXPORTERS)}")
+    return fmt
+
+
+def read_items(path):
+    """Yields the items of a jsonl, json or csv feed."""
+    fmt = feed_format(path)
+    with open(path, newline="" if fmt == "csv" else None, encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "json":
+            # resumed json feeds are several arrays appended to each other
+            decoder = json.JSONDecoder()
+            data = f.read()
+            pos = 0
+            while True:
+                while pos < len(data) and data[pos] in " \t\r\n":
+                    pos += 1
+                if pos >= len(data):
+                    break
+                items, pos = decoder.raw_decode(data, pos)
+                yield from items
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def listings(item):
+    """`category/subcategory` listings of an item, also for csv rows and items without `listed_in`."""
+    listed_in = item.get("listed_in") or []
+    if isinstance(listed_in, str):
+        # CsvItemExporter joins lists with commas
+        listed_in = listed_in.split(",")
+    if not listed_in and item.get("category") and item.get("subcategory"):
+        listed_in = [f"{item['category']}/{item['subcategory']}"]
+    return listed_in
+
+
+def is_listings_item(item):
+    """True for the trustpilot_url/listed_in rows of CompanyListingsItem."""
+    # csv rows have every column, the others empty
+    return {field for field, value in item.items() if value} <= {"trustpilot_url", "listed_in"}
+
+
+def merge_items(paths):
+    """Merges feeds into one item per canonical company URL.
+
+    The first item seen for a company is kept and the `listed_in` listings
+    of all its duplicates, and of its CompanyListingsItem rows, are added to
+    it. Listings of companies without an item are dropped. Returns (items,
+    total items read).
+    """
+    merged = {}
+    late_listings = {}
+    total = 0
+    for path in paths:
+        for item in read_items(path):
+            total += 1
+            key = normalize_company_url(item.get("trustpilot_url"))
+            if is_listings_item(item):
+                listed_in = late_listings.setdefault(key, [])
+            else:
+                if key not in merged:
+                    merged[key] = dict(item)
+                    merged[key]["listed_in"] = []
+                listed_in = merged[key]["listed_in"]
+            listed_in.extend(listing for listing in listings(item) if listing not in listed_in)
+    for key, extra in late_listings.items():
+        if key in merged:
+            listed_in = merged[key]["listed_in"]
+            listed_in.extend(listing for listing in extra if listing not in listed_in)
+    return list(merged.values()), total
+
+
+def write_items(items, path):
+    exporter_cls = EXPORTERS[feed_format(path)]
+    with open(path, "wb") as f:
+        exporter = exporter_cls(f)
+        exporter.start_exporting()
+        for item in items:
+            exporter.export_item(item)
+        exporter.finish_exporting()
+
+
+def merge_feeds(paths, output):
+    """Merges shard feeds into `output`, returns (items written, total items read)."""
+    items, total = merge_items(paths)
+    write_items(items, output)
+    return len(items), total
+
+
+class Command(ScrapyCommand):
+    """
+    example: scrapy crawl trustpilot -a country=DE -a shard=0/2 -o output_de_0.jsonl
+             scrapy crawl trustpilot -a country=DE -a shard=1/2 -o output_de_1.jsonl
+             scrapy merge output_de_0.jsonl output_de_1.jsonl -o output_de.jsonl
+    """
+
+    requires_project = False
+    default_settings = {"LOG_ENABLED": False}
+
+    def syntax(self):
+        return "[options] <feed> [<feed> ...] -o <output>"
+
+    def short_desc(self):
+        return "Merge sharded crawl outputs into one deduplicated feed"
+
+    def long_desc(self):
+        return (
+            "Merge the feeds of several crawls (jsonl, json or csv) into one. Companies "
+            "that appear in more than one feed are written once, keyed by their canonical "
+            "Trustpilot URL, with the category listings of all duplicates in `listed_in`."
+        )
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("-o", "--output", metavar="FILE", required=True,
+                            help="merged feed, the format is taken from the extension")
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError("No feeds to merge")
+        for path in args:
+            if not os.path.exists(path):
+                raise UsageError(f"{path} not found")
+        feed_format(opts.output)
+
+        written, total = merge_feeds(args, opts.output)
+        print(f"Merged {total} items from {len(args)} feeds into {written} companies: {opts.output}")
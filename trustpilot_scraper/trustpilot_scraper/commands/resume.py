@@ -0,0 +1,56 @@
+import json
+import os
+
+from scrapy.commands import BaseRunSpiderCommand
+from scrapy.exceptions import UsageError
+
+
+class Command(BaseRunSpiderCommand):
+    """
+    example: scrapy crawl trustpilot -a country=DE -s JOBDIR=jobs/de -o output_de.jsonl
+             (interrupted or killed)
+             scrapy resume jobs/de
+    """
+
+    requires_project = True
+
+    def syntax(self):
+        return "[options] <jobdir>"
+
+    def short_desc(self):
+        return "Resume a crawl from its job directory"
+
+    def long_desc(self):
+        return (
+            "Resume a crawl that was started with -s JOBDIR=<jobdir>. The spider, its "
+            "arguments and its feeds are read from <jobdir>/job.json; feeds are appended "
+            "to instead of overwritten. -a and -o options override the saved ones."
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        if len(args) != 1:
+            raise UsageError
+        jobdir = args[0]
+
+        job_file = os.path.join(jobdir, "job.json")
+        if not os.path.exists(job_file):
+            raise UsageError(f"{job_file} not found, was the crawl started with -s JOBDIR={jobdir}?")
+        with open(job_file) as f:
+            self.job = json.load(f)
+
+        self.settings.set("JOBDIR", jobdir, priority="cmdline")
+        if not (opts.output or opts.overwrite_output):
+            feeds = {uri: {**options, "overwrite": False} for uri, options in self.job["feeds"].items()}
+            self.settings.set("FEEDS", feeds, priority="cmdline")
+
+    def run(self, args, opts):
+        spargs = {**self.job["args"], **opts.spargs}
+        crawl_defer = self.crawler_process.crawl(self.job["spider"], **spargs)
+
+        if getattr(crawl_defer, "result", None) is not None and issubclass(crawl_defer.result.type, Exception):
+            self.exitcode = 1
+        else:
+            self.crawler_process.start()
+            if self.crawler_process.bootstrap_failed:
+                self.exitcode = 1
@@ -0,0 +1,44 @@
+# Contact extraction from company websites for ContactEnrichmentPipeline
+
+import re
+from urllib.parse import unquote
+
+# patterns run on the raw body, pages are never decoded or parsed
+MAILTO_RE = re.compile(rb"""href\s*=\s*["']?mailto:([^"'?\s>]+)""", re.I)
+TEL_RE = re.compile(rb"""href\s*=\s*["']?tel:([^"'\s>]+)""", re.I)
+EMAIL_RE = re.compile(rb"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,24}")
+# international numbers only, local formats are too easily confused with other digits
+PHONE_RE = re.compile(rb"(?<![\w+])\+[1-9]\d{0,2}(?:[ .-]?\(?\d{1,5}\)?){2,6}(?![\w])")
+# file names such as logo@2x.png look like addresses
+NOT_EMAIL_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".css", ".js")
+
+
+def clean_email(value):
+    email = unquote(value.decode("utf-8", "replace")).strip().lower()
+    if "@" not in email or email.endswith(NOT_EMAIL_SUFFIXES):
+        return None
+    return email
+
+
+def clean_phone(value):
+    phone = unquote(value.decode("utf-8", "replace")).strip()
+    # at least 7 digits, anything shorter is not a phone number
+    return phone if sum(c.isdigit() for c in phone) >= 7 else None
+
+
+def first_match(pattern, body, clean):
+    for match in pattern.finditer(body):
+        value = clean(match.group(1) if pattern.groups else match.group(0))
+        if value:
+            return value
+    return None
+
+
+def extract_contacts(body):
+    """(email, phone) found in an HTML page, None where nothing was found.
+
+    mailto: and tel: links win over addresses and numbers in the text.
+    """
+    email = first_match(MAILTO_RE, body, clean_email) or first_match(EMAIL_RE, body, clean_email)
+    phone = first_match(TEL_RE, body, clean_phone) or first_match(PHONE_RE, body, clean_phone)
+    return email, phone
@@ -0,0 +1,219 @@
+# Define here your scrapy extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import logging
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.feedexport import FeedExporter
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.job import job_dir
+from twisted.internet import task
+
+from trustpilot_scraper import signals as project_signals
+from trustpilot_scraper.instrumentation import metrics_for
+from trustpilot_scraper.proxypool import proxy_label
+
+
+class CheckpointExtension:
+    """Periodically asks stateful components to save their state on JOBDIR crawls.
+
+    Sends the `checkpoint` signal every CHECKPOINT_INTERVAL seconds and writes
+    job.json with the spider name, arguments and feeds so that
+    `scrapy resume <jobdir>` can restart the crawl.
+    """
+
+    def __init__(self, crawler, jobdir, interval):
+        self.logger = logging.getLogger(__name__)
+        self.crawler = crawler
+        self.jobdir = jobdir
+        self.interval = interval
+        self.loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        jobdir = job_dir(crawler.settings)
+        if not jobdir:
+            raise NotConfigured
+        ext = cls(crawler, jobdir, crawler.settings.getfloat("CHECKPOINT_INTERVAL"))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        job = {
+            "spider": spider.name,
+            "args": getattr(spider, "job_args", {}),
+            "feeds": {str(uri): options for uri, options in self.crawler.settings.getdict("FEEDS").items()},
+        }
+        with open(os.path.join(self.jobdir, "job.json"), "w") as f:
+            json.dump(job, f, indent=2, default=str)
+
+        if self.interval > 0:
+            self.loop = task.LoopingCall(self.checkpoint)
+            self.loop.start(self.interval, now=False)
+
+    def checkpoint(self):
+        self.logger.debug(f"Checkpointing crawl state to {self.jobdir}")
+        # an exception would stop the LoopingCall, and no later checkpoint would run
+        try:
+            # items must reach the feeds before their requests are marked done
+            self.flush_feeds()
+            self.crawler.signals.send_catch_log(signal=project_signals.checkpoint)
+        except Exception:
+            self.logger.error(f"Checkpoint to {self.jobdir} failed", exc_info=True)
+            self.crawler.stats.inc_value("checkpoint/error_count")
+            return
+        self.crawler.stats.inc_value("checkpoint/count")
+
+    def flush_feeds(self):
+        for extension in self.crawler.extensions.middlewares:
+            if isinstance(extension, FeedExporter):
+                for slot in extension.slots:
+                    # a feed only gets its file with its first item
+                    if slot.file is not None:
+                        slot.file.flush()
+
+    def spider_closed(self, spider):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+
+
+class InstrumentationExtension:
+    """Collects hot-path metrics and exports them periodically (INSTRUMENTATION_ENABLED).
+
+    Download latency is recorded per download slot and per proxy. Every
+    INSTRUMENTATION_INTERVAL seconds the scheduler, frontier and downloader
+    queue depths and each slot's delay (which shows AutoThrottle backoff) are
+    sampled, and a record with all histograms, gauges and numeric crawl stats
+    is appended to INSTRUMENTATION_FILE as one JSON line. Callback and
+    pipeline timings come from CallbackTimingMiddleware and
+    InstrumentedItemPipelineManager. With INSTRUMENTATION_PROMETHEUS_PORT set
+    the same metrics are served in Prometheus text format on 127.0.0.1.
+    """
+
+    def __init__(self, crawler, metrics, path, interval, prometheus_port):
+        self.logger = logging.getLogger(__name__)
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.prometheus_port = prometheus_port
+        self.download_latency = metrics.histogram("download_latency_seconds", "Download latency per download slot")
+        self.proxy_latency = metrics.histogram("proxy_latency_seconds", "Download latency per proxy")
+        self.file = None
+        self.loop = None
+        self.listener = None
+        self.started = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("INSTRUMENTATION_ENABLED"):
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            metrics_for(crawler),
+            settings.get("INSTRUMENTATION_FILE"),
+            settings.getfloat("INSTRUMENTATION_INTERVAL"),
+            settings.getint("INSTRUMENTATION_PROMETHEUS_PORT"),
+        )
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+        if self.path:
+            self.file = open(self.path, "a", encoding="utf-8")
+        if self.prometheus_port:
+            self.listen(self.prometheus_port)
+        if self.interval > 0:
+            self.loop = task.LoopingCall(self.sample)
+            self.loop.start(self.interval, now=False)
+
+    def listen(self, port):
+        from twisted.internet import reactor
+        from twisted.web.resource import Resource
+        from twisted.web.server import Site
+
+        metrics = self
+
+        class MetricsResource(Resource):
+            isLeaf = True
+
+            def render_GET(self, request):
+                request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+                return metrics.prometheus().encode("utf-8")
+
+        self.listener = reactor.listenTCP(port, Site(MetricsResource()), interface="127.0.0.1")
+        self.logger.info(f"Serving Prometheus metrics on http://127.0.0.1:{port}/metrics")
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is None:
+            return
+        # same default as the downloader: one slot per host
+        slot = request.meta.get("download_slot") or urlparse_cached(request).hostname
+        self.download_latency.observe(latency, slot=slot)
+        proxy = request.meta.get("proxy")
+        self.proxy_latency.observe(latency, proxy=proxy_label(proxy) if proxy else "direct")
+
+    def sample_queues(self):
+        engine = self.crawler.engine
+        enqueued = self.stats.get_value("scheduler/enqueued", 0)
+        dequeued = self.stats.get_value("scheduler/dequeued", 0)
+        self.metrics.set_gauge("scheduler_pending_requests", enqueued - dequeued)
+        parked = self.stats.get_value("frontier/parked", 0) - self.stats.get_value("frontier/released", 0)
+        self.metrics.set_gauge("frontier_parked_requests", parked)
+        if engine is None or engine.downloader is None:
+            return
+        downloader = engine.downloader
+        self.metrics.set_gauge("downloader_active_requests", len(downloader.active))
+        for name in ("slot_active_requests", "slot_queued_requests", "slot_delay_seconds"):
+            self.metrics.clear_gauge(name)
+        for key, slot in downloader.slots.items():
+            self.metrics.set_gauge("slot_active_requests", len(slot.active), slot=key)
+            self.metrics.set_gauge("slot_queued_requests", len(slot.queue), slot=key)
+            self.metrics.set_gauge("slot_delay_seconds", round(slot.delay, 3), slot=key)
+
+    def crawl_stats(self):
+        return {
+            key: value for key, value in self.stats.get_stats().items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+    def sample(self):
+        self.sample_queues()
+        if self.file:
+            record = {
+                "time": round(time.time(), 3),
+                "elapsed": round(time.time() - self.started, 3),
+                **self.metrics.snapshot(),
+                "stats": self.crawl_stats(),
+            }
+            self.file.write(json.dumps(record, default=str) + "\n")
+            self.file.flush()
+
+    def prometheus(self):
+        self.sample_queues()
+        lines = [self.metrics.prometheus(), "# TYPE scrapy_stat gauge"]
+        for key, value in self.crawl_stats().items():
+            lines.append(f'scrapy_stat{{key="{key}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def spider_closed(self, spider):
+        if self.loop and self.loop.running:
+            self.loop.stop()
+        self.sample()
+        if self.file:
+            self.file.close()
+        if self.listener:
+            self.listener.stopListening()
@@ -0,0 +1,192 @@
+# Download handler keeping impersonated curl_cffi sessions open between requests
+
+import logging
+import time
+from collections import OrderedDict
+
+from curl_cffi import CurlInfo
+from curl_cffi.curl import CURL_WRITEFUNC_ERROR
+from curl_cffi.requests import AsyncSession
+from scrapy.http.headers import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import deferred_from_coro
+from scrapy_impersonate.handler import ASYNC_HANDLER_API, ImpersonateDownloadHandler
+from scrapy_impersonate.parser import CurlOptionsParser, RequestParser
+from twisted.internet.defer import CancelledError
+
+logger = logging.getLogger(__name__)
+
+
+class PooledSession:
+    def __init__(self, key, session):
+        self.key = key
+        self.session = session
+        # requests in flight, a session is only closed when idle
+        self.active = 0
+
+
+class PooledImpersonateDownloadHandler(ImpersonateDownloadHandler):
+    """ImpersonateDownloadHandler with a pool of persistent sessions.
+
+    scrapy-impersonate opens a new curl_cffi session, so a new connection and
+    TLS handshake, for every impersonated request. Here sessions are kept per
+    (proxy, browser, curl options), and curl reuses their connections
+    (keep-alive, HTTP/2 multiplexing) across requests. At most
+    IMPERSONATE_POOL_SIZE sessions are kept, the least recently used idle one
+    is closed first; 0 opens a session per request like scrapy-impersonate.
+
+    Requests without an "impersonate" meta key are impersonated as
+    IMPERSONATE_BROWSER (None = plain Scrapy downloads). With
+    IMPERSONATE_SESSION_COOKIES sessions keep the cookies they receive, tying
+    them to the proxy and fingerprint that earned them; by default cookies
+    are left to Scrapy's CookiesMiddleware. Like Scrapy's HTTP handler, it
+    cancels downloads larger than DOWNLOAD_MAXSIZE or the "download_maxsize"
+    meta key, which scrapy-impersonate ignores.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        settings = crawler.settings
+        self.stats = crawler.stats
+        self.browser = settings.get("IMPERSONATE_BROWSER")
+        self.pool_size = settings.getint("IMPERSONATE_POOL_SIZE")
+        self.max_clients = settings.getint("IMPERSONATE_SESSION_MAX_CLIENTS") or settings.getint(
+            "CONCURRENT_REQUESTS_PER_DOMAIN")
+        self.session_cookies = settings.getbool("IMPERSONATE_SESSION_COOKIES")
+        self.verify = settings.getbool("IMPERSONATE_VERIFY_TLS")
+        self.maxsize = settings.getint("DOWNLOAD_MAXSIZE")
+        # key -> PooledSession, least recently used first
+        self.sessions = OrderedDict()
+
+    def with_browser(self, request):
+        if self.browser and "impersonate" not in request.meta:
+            request.meta["impersonate"] = self.browser
+        return request
+
+    if ASYNC_HANDLER_API:
+
+        async def download_request(self, request):
+            return await super().download_request(self.with_browser(request))
+
+        async def close(self):
+            await self.close_sessions()
+            await super().close()
+
+    else:
+
+        def download_request(self, request, spider):
+            return super().download_request(self.with_browser(request), spider)
+
+        def close(self):
+            d = deferred_from_coro(self.close_sessions())
+            d.addBoth(lambda _: super(PooledImpersonateDownloadHandler, self).close())
+            return d
+
+    def open_session(self, proxy, browser, curl_options):
+        self.stats.inc_value("impersonate/sessions_opened")
+        return AsyncSession(
+            max_clients=self.max_clients,
+            curl_options=curl_options,
+            curl_infos=[CurlInfo.NUM_CONNECTS],
+            impersonate=browser,
+            proxy=proxy,
+            verify=self.verify,
+            discard_cookies=not self.session_cookies,
+        )
+
+    def acquire(self, proxy, browser, curl_options):
+        # curl options are part of the key, they are set per session (e.g. proxy credentials)
+        key = (proxy, browser, tuple(sorted((int(option), repr(value)) for option, value in curl_options.items())))
+        if self.pool_size <= 0:
+            pooled = PooledSession(None, self.open_session(proxy, browser, curl_options))
+            pooled.active += 1
+            return pooled
+        pooled = self.sessions.get(key)
+        if pooled is None:
+            pooled = self.sessions[key] = PooledSession(key, self.open_session(proxy, browser, curl_options))
+        else:
+            self.stats.inc_value("impersonate/sessions_reused")
+            self.sessions.move_to_end(key)
+        pooled.active += 1
+        return pooled
+
+    async def release(self, pooled):
+        pooled.active -= 1
+        if pooled.key is None:
+            await pooled.session.close()
+            self.stats.inc_value("impersonate/sessions_closed")
+            return
+        # the pool may grow past its size while all sessions are busy, shrink it again
+        while len(self.sessions) > self.pool_size:
+            key = next((key for key, entry in self.sessions.items() if not entry.active), None)
+            if key is None:
+                break
+            await self.sessions.pop(key).session.close()
+            self.stats.inc_value("impersonate/sessions_closed")
+
+    async def close_sessions(self):
+        sessions, self.sessions = self.sessions, OrderedDict()
+        for pooled in sessions.values():
+            await pooled.session.close()
+        if sessions:
+            logger.debug(f"Closed {len(sessions)} impersonation sessions")
+
+    def record_connection(self, request, response):
+        new_connections = response.infos.get(CurlInfo.NUM_CONNECTS, 0)
+        self.stats.inc_value("impersonate/requests")
+        if new_connections:
+            self.stats.inc_value("impersonate/connections_new", new_connections)
+            if request.url.startswith("https://"):
+                self.stats.inc_value("impersonate/tls_handshakes", new_connections)
+        else:
+            self.stats.inc_value("impersonate/connections_reused")
+
+    async def _download_request(self, request):
+        # same request translation as scrapy-impersonate, on a copy as CurlOptionsParser pops headers
+        request_copy = request.copy()
+        curl_options = CurlOptionsParser(request_copy).as_dict()
+        request_args = RequestParser(request_copy).as_dict()
+        if "download_timeout" in request.meta:
+            request_args.setdefault("timeout", request.meta["download_timeout"])
+
+        # the body is collected here so that curl can be stopped once it gets too large
+        maxsize = request.meta.get("download_maxsize", self.maxsize)
+        body = bytearray()
+
+        def receive(chunk):
+            body.extend(chunk)
+            if maxsize and len(body) > maxsize:
+                return CURL_WRITEFUNC_ERROR
+            return len(chunk)
+
+        pooled = self.acquire(request_args["proxy"], request_args["impersonate"], curl_options)
+        try:
+            start_time = time.time()
+            response = await pooled.session.request(**request_args, content_callback=receive)
+            download_latency = time.time() - start_time
+        except Exception:
+            if maxsize and len(body) > maxsize:
+                self.stats.inc_value("impersonate/maxsize_cancelled")
+                message = (f"Cancelling download of {request.url}: received response size "
+                           f"({len(body)}) larger than download max size ({maxsize}).")
+                logger.warning(message)
+                raise CancelledError(message) from None
+            raise
+        finally:
+            await self.release(pooled)
+        self.record_connection(request, response)
+        body = bytes(body)
+
+        headers = Headers(response.headers.multi_items())
+        headers.pop("Content-Encoding", None)
+        respcls = responsetypes.from_args(headers=headers, url=response.url, body=body)
+        resp = respcls(
+            url=response.url,
+            status=response.status_code,
+            headers=headers,
+            body=body,
+            flags=["impersonate"],
+            request=request,
+        )
+        resp.meta["download_latency"] = download_latency
+        return resp
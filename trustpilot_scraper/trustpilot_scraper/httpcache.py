@@ -0,0 +1,199 @@
+# HTTP cache storage and policy for HTTPCACHE_ENABLED crawls
+
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy import signals
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+from trustpilot_scraper.blocks import OK, NOT_FOUND, ResponseClassifier
+from trustpilot_scraper.utils import url_kind
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class Codec:
+    """Compresses response bodies; the codec name is stored with every row."""
+
+    def __init__(self, name, level=None):
+        if name == "zstd" and zstandard is None:
+            logger.info("zstandard is not installed, compressing the HTTP cache with zlib")
+            name = "zlib"
+        self.name = name
+        self.level = level
+        if name == "zstd":
+            self.compressor = zstandard.ZstdCompressor(level=level or 3)
+            self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        if self.name == "zstd":
+            return self.compressor.compress(data)
+        if self.name == "zlib":
+            return zlib.compress(data, self.level or 6)
+        return data
+
+    def decompress(self, data, name):
+        """Decompresses a body written with codec `name`, None if that codec is unavailable."""
+        if name == "zstd":
+            if zstandard is None:
+                return None
+            if self.name != "zstd":
+                self.decompressor = zstandard.ZstdDecompressor()
+            return self.decompressor.decompress(data)
+        if name == "zlib":
+            return zlib.decompress(data)
+        return data
+
+
+class SqliteCacheStorage:
+    """Keeps cached responses in one SQLite file per spider with compressed bodies.
+
+    Rows are keyed on the request fingerprint and store the page type and
+    the time they were stored, which TtlPolicy uses for freshness. Unlike
+    FilesystemCacheStorage this creates a single file instead of a
+    directory with six files per request.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.codec = Codec(settings.get("HTTPCACHE_COMPRESSION"), settings.getint("HTTPCACHE_COMPRESSION_LEVEL") or None)
+        self.commit_every = 100
+        self.pending = 0
+        self.conn = None
+
+    def open_spider(self, spider):
+        path = os.path.join(self.cachedir, f"{spider.name}.sqlite")
+        logger.debug(f"Using SQLite cache storage in {path}")
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " fingerprint BLOB PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " status INTEGER NOT NULL,"
+            " headers BLOB NOT NULL,"
+            " body BLOB NOT NULL,"
+            " codec TEXT NOT NULL,"
+            " stored_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_age ON responses (kind, stored_at)")
+        self.conn.commit()
+        spider.crawler.signals.connect(self.response_received, signal=signals.response_received)
+
+    def close_spider(self, spider):
+        spider.crawler.signals.disconnect(self.response_received, signal=signals.response_received)
+        self.conn.commit()
+        self.conn.close()
+
+    def retrieve_response(self, spider, request):
+        row = self.conn.execute(
+            "SELECT url, status, headers, body, codec, stored_at FROM responses WHERE fingerprint = ?",
+            (self._fingerprinter.fingerprint(request),),
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, raw_headers, body, codec, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+        body = self.codec.decompress(body, codec)
+        if body is None:
+            return None
+
+        # TtlPolicy computes freshness from the time the response was stored
+        request.meta["cache_stored_at"] = stored_at
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (fingerprint, url, kind, status, headers, body, codec, stored_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self._fingerprinter.fingerprint(request),
+                response.url,
+                url_kind(request.url),
+                response.status,
+                headers_dict_to_raw(response.headers),
+                self.codec.compress(response.body),
+                self.codec.name,
+                time.time(),
+            ),
+        )
+        self._written()
+
+    def response_received(self, response, request, spider):
+        # a 304 confirmed the cached copy, it is fresh again for another TTL
+        if request.meta.pop("cache_revalidated", False):
+            self.conn.execute(
+                "UPDATE responses SET stored_at = ? WHERE fingerprint = ?",
+                (time.time(), self._fingerprinter.fingerprint(request)),
+            )
+            self._written()
+
+    def _written(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+
+
+class TtlPolicy(RFC2616Policy):
+    """RFC2616Policy with per page type expiration instead of the server's cache headers.
+
+    A cached response is fresh for HTTPCACHE_TTL[<page type>] seconds after
+    it was stored (negative: forever). Stale responses are revalidated with
+    If-None-Match/If-Modified-Since when they carry an ETag or
+    Last-Modified, and re-downloaded otherwise. Responses are stored
+    regardless of expiration headers, except for HTTPCACHE_IGNORE_HTTP_CODES,
+    304s, no-store and ban or captcha pages.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ttls = settings.getdict("HTTPCACHE_TTL")
+        self.ignore_http_codes = [int(code) for code in settings.getlist("HTTPCACHE_IGNORE_HTTP_CODES")]
+        # the cache sees responses before BlockDetectionMiddleware does
+        self.classifier = ResponseClassifier.from_settings(settings)
+
+    def ttl(self, request):
+        kind = url_kind(request.url)
+        return float(self.ttls.get(kind, self.ttls.get("default", 0)))
+
+    def should_cache_response(self, response, request):
+        if response.status == 304 or response.status in self.ignore_http_codes:
+            return False
+        if self.classifier.classify(response) not in (OK, NOT_FOUND):
+            return False
+        return b"no-store" not in self._parse_cachecontrol(response)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if b"no-cache" not in self._parse_cachecontrol(request):
+            ttl = self.ttl(request)
+            stored_at = request.meta.get("cache_stored_at")
+            if ttl < 0 or (stored_at is not None and time.time() - stored_at < ttl):
+                return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        valid = super().is_cached_response_valid(cachedresponse, response, request)
+        if valid and response.status == 304:
+            request.meta["cache_revalidated"] = True
+        return valid
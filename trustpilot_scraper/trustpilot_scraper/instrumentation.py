@@ -0,0 +1,180 @@
+# Metrics collected by the instrumentation components (INSTRUMENTATION_ENABLED)
+
+import time
+from collections import deque
+from weakref import WeakKeyDictionary
+
+from scrapy.pipelines import ItemPipelineManager
+from scrapy.utils.defer import deferred_f_from_coro_f
+from twisted.internet.defer import Deferred
+
+# seconds, same spacing as the Prometheus client defaults with a finer low end
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels)
+
+
+class Histogram:
+    """Fixed-bucket histogram with one series per label set."""
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            # bucket counts (+Inf last), sum, count, max
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+        series[2] += 1
+        if value > series[3]:
+            series[3] = value
+
+    def quantile(self, counts, count, q):
+        """Upper bound of the bucket holding the q-quantile."""
+        rank = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self):
+        """{labels: {count, sum, mean, p50, p90, p99, max}} for the JSON-lines file."""
+        summary = {}
+        for key, (counts, total, count, maximum) in self.series.items():
+            summary[format_labels(key) or "all"] = {
+                "count": count,
+                "sum": round(total, 6),
+                "mean": round(total / count, 6) if count else None,
+                "p50": self.quantile(counts, count, 0.5),
+                "p90": self.quantile(counts, count, 0.9),
+                "p99": self.quantile(counts, count, 0.99),
+                "max": round(maximum, 6),
+            }
+        return summary
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count, _) in self.series.items():
+            labels = format_labels(key)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return lines
+
+
+class Metrics:
+    """Histograms and gauges of one crawl, shared by the instrumentation components."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+
+    def histogram(self, name, description):
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, description)
+        return self.histograms[name]
+
+    def set_gauge(self, name, value, **labels):
+        self.gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def clear_gauge(self, name):
+        self.gauges.pop(name, None)
+
+    def snapshot(self):
+        return {
+            "histograms": {name: h.summary() for name, h in self.histograms.items()},
+            "gauges": {
+                name: {format_labels(key) or "all": value for key, value in series.items()}
+                for name, series in self.gauges.items()
+            },
+        }
+
+    def prometheus(self):
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.prometheus())
+        for name, series in self.gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series.items():
+                labels = format_labels(key)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = WeakKeyDictionary()
+
+
+def metrics_for(crawler):
+    """The Metrics of a crawler, created on first use."""
+    if crawler not in _metrics:
+        _metrics[crawler] = Metrics()
+    return _metrics[crawler]
+
+
+class InstrumentedItemPipelineManager(ItemPipelineManager):
+    """ITEM_PROCESSOR that times every pipeline's process_item when INSTRUMENTATION_ENABLED is set.
+
+    CPU time covers the synchronous part of process_item. Wall time also
+    covers the wait for a returned Deferred, e.g. DatabaseSinkPipeline's
+    backpressure.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        manager = super().from_crawler(crawler)
+        if crawler.settings.getbool("INSTRUMENTATION_ENABLED"):
+            manager.instrument(metrics_for(crawler))
+        return manager
+
+    def instrument(self, metrics):
+        wall = metrics.histogram("pipeline_wall_seconds", "Wall time of process_item per pipeline")
+        cpu = metrics.histogram("pipeline_cpu_seconds", "CPU time of process_item per pipeline")
+        self.methods["process_item"] = deque(
+            self.timed(pipe, wall, cpu) for pipe in self.middlewares if hasattr(pipe, "process_item")
+        )
+
+    @staticmethod
+    def timed(pipe, wall, cpu):
+        process_item = deferred_f_from_coro_f(pipe.process_item)
+        name = type(pipe).__name__
+
+        def timed_process_item(item, spider):
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            try:
+                result = process_item(item, spider)
+            except Exception:
+                cpu.observe(time.thread_time() - start_cpu, pipeline=name)
+                wall.observe(time.perf_counter() - start, pipeline=name)
+                raise
+            cpu.observe(time.thread_time() - start_cpu, pipeline=name)
+            if isinstance(result, Deferred) and not result.called:
+                def observe(value):
+                    wall.observe(time.perf_counter() - start, pipeline=name)
+                    return value
+                result.addBoth(observe)
+            else:
+                wall.observe(time.perf_counter() - start, pipeline=name)
+            return result
+
+        return timed_process_item
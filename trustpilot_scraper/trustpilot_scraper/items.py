@@ -18,3 +18,24 @@ class TrustpilotScraperItem(scrapy.Item):
     phone = scrapy.Field()
     trustpilot_url = scrapy.Field()
     country = scrapy.Field()
+    listed_in = scrapy.Field()
+
+
+class ReviewItem(scrapy.Item):
+    trustpilot_url = scrapy.Field()
+    country = scrapy.Field()
+    review_id = scrapy.Field()
+    rating = scrapy.Field()
+    title = scrapy.Field()
+    text = scrapy.Field()
+    author = scrapy.Field()
+    published_at = scrapy.Field()
+    experienced_at = scrapy.Field()
+    reply_text = scrapy.Field()
+    reply_published_at = scrapy.Field()
+
+
+class CompanyListingsItem(scrapy.Item):
+    """Complete `listed_in` of a company whose item was passed on before all its listings were crawled."""
+    trustpilot_url = scrapy.Field()
+    listed_in = scrapy.Field()
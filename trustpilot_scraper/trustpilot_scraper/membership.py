@@ -0,0 +1,240 @@
+# Membership backends for the dedup pipelines
+#
+# All backends share the same small interface: `key in backend`,
+# `backend.add(key)` (returns True if the key was new), `len(backend)` and
+# `backend.dump(path)`. Dumps start with a one-line JSON header so that
+# `load_membership()` can restore any of them.
+
+import bisect
+import hashlib
+import json
+import math
+from array import array
+
+
+def _hash64(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _hash_pair(key):
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+def _write_dump(path, header, payload):
+    with open(path, "wb") as f:
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        f.write(payload)
+
+
+class ExactSet:
+    """Plain `set` backend. Exact, but uses ~100+ bytes per URL."""
+
+    def __init__(self):
+        self.keys = set()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key):
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def dump(self, path):
+        _write_dump(path, {"type": "set"}, "\n".join(self.keys).encode("utf-8"))
+
+    @classmethod
+    def _load(cls, header, payload):
+        backend = cls()
+        backend.keys = set(payload.decode("utf-8").split("\n")) if payload else set()
+        return backend
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `error_rate`."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def contains_hashes(self, h1, h2):
+        bits, num_bits = self.bits, self.num_bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add_hashes(self, h1, h2):
+        bits, num_bits = self.bits, self.num_bits
+        for i in range(self.num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    """Bloom filter that grows by adding slices, keeping the total error rate bounded.
+
+    Each new slice has `growth` times the capacity of the previous one and a
+    tighter error rate, so the compound false-positive rate stays below
+    `error_rate` however many keys are added.
+    """
+
+    TIGHTENING = 0.9
+
+    def __init__(self, initial_capacity=1_000_000, error_rate=0.001, growth=2):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.filters = []
+
+    def __contains__(self, key):
+        h1, h2 = _hash_pair(key)
+        return any(f.contains_hashes(h1, h2) for f in self.filters)
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def add(self, key):
+        h1, h2 = _hash_pair(key)
+        if any(f.contains_hashes(h1, h2) for f in self.filters):
+            return False
+        if not self.filters or self.filters[-1].full:
+            n = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.growth ** n,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** n,
+            ))
+        self.filters[-1].add_hashes(h1, h2)
+        return True
+
+    def dump(self, path):
+        header = {
+            "type": "bloom",
+            "initial_capacity": self.initial_capacity,
+            "error_rate": self.error_rate,
+            "growth": self.growth,
+            "filters": [
+                {"capacity": f.capacity, "error_rate": f.error_rate, "count": f.count}
+                for f in self.filters
+            ],
+        }
+        _write_dump(path, header, b"".join(bytes(f.bits) for f in self.filters))
+
+    @classmethod
+    def _load(cls, header, payload):
+        backend = cls(header["initial_capacity"], header["error_rate"], header["growth"])
+        offset = 0
+        for spec in header["filters"]:
+            f = BloomFilter(spec["capacity"], spec["error_rate"])
+            f.bits = bytearray(payload[offset:offset + len(f.bits)])
+            f.count = spec["count"]
+            offset += len(f.bits)
+            backend.filters.append(f)
+        return backend
+
+
+class SortedHashSet:
+    """Sorted array of 64-bit key hashes (8 bytes per key).
+
+    New hashes go to a small buffer that is merged into the sorted array once
+    it grows past `merge_ratio` of the array size. The false-positive rate is
+    about n / 2**64, i.e. negligible at crawl scale.
+    """
+
+    def __init__(self, merge_ratio=0.05, min_buffer=10_000):
+        self.merge_ratio = merge_ratio
+        self.min_buffer = min_buffer
+        self.hashes = array("Q")
+        self.buffer = set()
+
+    def _in_sorted(self, h):
+        i = bisect.bisect_left(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
+
+    def __contains__(self, key):
+        h = _hash64(key)
+        return h in self.buffer or self._in_sorted(h)
+
+    def __len__(self):
+        return len(self.hashes) + len(self.buffer)
+
+    def add(self, key):
+        h = _hash64(key)
+        if h in self.buffer or self._in_sorted(h):
+            return False
+        self.buffer.add(h)
+        if len(self.buffer) >= max(self.min_buffer, len(self.hashes) * self.merge_ratio):
+            self._merge()
+        return True
+
+    def _merge(self):
+        # merged in place from the back: runs of stored hashes are moved as raw
+        # memory, so neither a second array nor a Python int per stored hash
+        # is needed
+        new = sorted(self.buffer)
+        end = len(self.hashes)
+        self.hashes.extend(new)
+        view = memoryview(self.hashes).cast("B")
+        size = self.hashes.itemsize
+        shift = len(new)
+        for h in reversed(new):
+            i = bisect.bisect_left(self.hashes, h, 0, end)
+            view[(i + shift) * size:(end + shift) * size] = view[i * size:end * size]
+            self.hashes[i + shift - 1] = h
+            end = i
+            shift -= 1
+        view.release()
+        self.buffer = set()
+
+    def dump(self, path):
+        self._merge()
+        _write_dump(path, {"type": "hashes", "count": len(self.hashes)}, self.hashes.tobytes())
+
+    @classmethod
+    def _load(cls, header, payload):
+        backend = cls()
+        backend.hashes.frombytes(payload)
+        return backend
+
+
+BACKENDS = {
+    "set": ExactSet,
+    "bloom": ScalableBloomFilter,
+    "hashes": SortedHashSet,
+}
+
+
+def make_membership(settings):
+    """Builds the backend selected by the DEDUP_BACKEND setting."""
+    name = settings.get("DEDUP_BACKEND", "set")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown DEDUP_BACKEND {name!r}, expected one of {sorted(BACKENDS)}")
+    if name == "bloom":
+        return ScalableBloomFilter(
+            initial_capacity=settings.getint("DEDUP_INITIAL_CAPACITY", 1_000_000),
+            error_rate=settings.getfloat("DEDUP_ERROR_RATE", 0.001),
+        )
+    return BACKENDS[name]()
+
+
+def load_membership(path):
+    """Restores a backend written by `dump()`."""
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        payload = f.read()
+    return BACKENDS[header["type"]]._load(header, payload)
@@ -4,12 +4,28 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.http import Request
+from scrapy.settings import Settings
+from scrapy.utils.request import request_from_dict
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+import json
 import os
-import random
+import re
 import logging
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlparse
+
+from trustpilot_scraper import blocks
+from trustpilot_scraper.instrumentation import metrics_for
+from trustpilot_scraper.items import CompanyListingsItem, TrustpilotScraperItem
+from trustpilot_scraper.proxypool import ProxyPool, proxy_label
+from trustpilot_scraper.signals import checkpoint, response_blocked
+from trustpilot_scraper.storage import FingerprintStore, SeenUrlStore
+from trustpilot_scraper.utils import is_company_url, normalize_company_url, read_state, state_path, write_state
 
 
 class TrustpilotScraperSpiderMiddleware:
@@ -104,8 +120,11 @@ class TrustpilotScraperDownloaderMiddleware:
 
 
 class ProxyMiddleware:
-    def __init__(self):
+    def __init__(self, settings=None, stats=None):
         self.logger = logging.getLogger(__name__)
+        self.stats = stats
+        self.crawler = None
+        settings = settings or Settings()
         
         # Try to get proxy from environment variables
         self.http_proxy = os.getenv("HTTP_PROXY")
@@ -129,14 +148,52 @@ class ProxyMiddleware:
             env_proxies = [p.strip() for p in proxy_list_env.split(',') if p.strip()]
             self.proxy_list.extend(env_proxies)
             self.logger.info(f"Loaded {len(env_proxies)} proxies from PROXY_LIST environment variable")
+
+        self.pool = ProxyPool(
+            self.proxy_list,
+            cooldown=settings.getfloat("PROXY_COOLDOWN", 30),
+            max_cooldown=settings.getfloat("PROXY_MAX_COOLDOWN", 1800),
+            ban_cooldown=settings.getfloat("PROXY_BAN_COOLDOWN", 600),
+            sticky=settings.getbool("PROXY_STICKY_SESSIONS", False),
+        )
+        self.max_retries = settings.getint("PROXY_MAX_RETRIES", 5)
+        # responses RetryMiddleware will retry, it sees them after this middleware
+        self.retry_http_codes = {int(code) for code in settings.getlist("RETRY_HTTP_CODES")}
+
+        # Per-proxy download slots
+        self.slots_enabled = settings.getbool("PROXY_SLOTS_ENABLED", False)
+        self.slot_concurrency = settings.getint("PROXY_SLOT_CONCURRENCY", 2)
+        self.max_concurrency = settings.getint("PROXY_SLOTS_MAX_CONCURRENCY", 256)
+        self.base_concurrency = settings.getint("CONCURRENT_REQUESTS", 16)
+        # the budget ContactEnrichmentPipeline adds on top of CONCURRENT_REQUESTS
+        self.extra_concurrency = settings.getint("ENRICH_CONCURRENCY") if settings.getbool("ENRICH_ENABLED") else 0
     
     @classmethod
     def from_crawler(cls, crawler):
-        return cls()
+        s = cls(crawler.settings, crawler.stats)
+        s.crawler = crawler
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        # ban and captcha pages are recognized by BlockDetectionMiddleware
+        crawler.signals.connect(s.response_blocked, signal=response_blocked)
+        return s
+
+    def spider_opened(self, spider):
+        if self.slots_enabled and self.pool:
+            self.logger.info(f"Using one download slot per proxy for {len(self.pool)} proxies")
+            self.update_stats()
+
+    def session_key(self, request):
+        # sticky sessions are keyed on the "proxy_session" meta key only,
+        # requests without one are not pinned to a proxy
+        return request.meta.get("proxy_session")
 
     def process_request(self, request, spider):
-        # Skip if proxy already set
-        if "proxy" in request.meta:
+        # Skip if proxy already set, unless the pool assigned it (e.g. a retried request)
+        if "proxy" in request.meta and not request.meta.get("proxy_from_pool"):
+            return
+        # process_exception already picked a different pool proxy for this retry
+        if request.meta.pop("proxy_assigned", False):
             return
         
         # Check if spider has proxy parameter
@@ -145,10 +202,12 @@ class ProxyMiddleware:
             proxy = spider.proxy
             self.logger.debug(f"Using spider proxy parameter: {proxy}")
         
-        # Use rotating proxy list if available
-        elif self.proxy_list:
-            proxy = random.choice(self.proxy_list)
-            self.logger.debug(f"Using rotating proxy: {proxy}")
+        # Use the health-scored proxy pool if available
+        elif self.pool:
+            proxy = self.pool.get(session=self.session_key(request))
+            request.meta["proxy_from_pool"] = True
+            self.logger.debug(f"Using pool proxy: {proxy_label(proxy)}")
+            self.assign_slot(request, proxy)
         
         # Fall back to environment variables
         elif request.url.startswith('https') and self.https_proxy:
@@ -160,17 +219,526 @@ class ProxyMiddleware:
         
         if proxy:
             request.meta["proxy"] = proxy
-            self.logger.info(f"Request to {request.url} using proxy: {proxy}")
+            self.logger.info(f"Request to {request.url} using proxy: {proxy_label(proxy)}")
+
+    def assign_slot(self, request, proxy):
+        """Puts a pool request into its proxy's download slot (PROXY_SLOTS_ENABLED).
+
+        Every slot keeps its own delay and AutoThrottle state and is limited to
+        PROXY_SLOT_CONCURRENCY parallel requests, i.e. per exit IP.
+        """
+        if not self.slots_enabled:
+            return
+        # requests with a slot of their own (e.g. contact enrichment) keep it
+        if not request.meta.get("download_slot", "proxy:").startswith("proxy:"):
+            return
+        key = f"proxy:{proxy_label(proxy)}"
+        request.meta["download_slot"] = key
+        if self.crawler and self.crawler.engine:
+            self.crawler.engine.downloader.per_slot_settings.setdefault(key, {"concurrency": self.slot_concurrency})
+
+    def response_blocked(self, request, response, kind, spider):
+        proxy = request.meta.get("proxy")
+        if proxy and request.meta.get("proxy_from_pool"):
+            self.logger.warning(f"Proxy {proxy_label(proxy)} got a ban signal ({kind}, {response.status}) on {request.url}")
+            self.pool.record_ban(proxy)
+            self.stats.inc_value("proxy_pool/ban_count")
+            self.update_stats()
+
+    def process_response(self, request, response, spider):
+        # block pages never get here, BlockDetectionMiddleware replaces them with a retry
+        proxy = request.meta.get("proxy")
+        if not (proxy and request.meta.get("proxy_from_pool")):
+            return response
+        if response.status in self.retry_http_codes:
+            # 502/503/504 are mostly the proxy gateway failing, RetryMiddleware retries them
+            self.pool.record_failure(proxy)
+            self.stats.inc_value("proxy_pool/failure_count")
+        else:
+            self.pool.record_success(proxy, request.meta.get("download_latency"))
+        self.update_stats()
+        return response
     
     def process_exception(self, request, exception, spider):
         # Retry with different proxy if available
-        if self.proxy_list and len(self.proxy_list) > 1:
-            old_proxy = request.meta.get('proxy')
-            # Try to use a different proxy
-            available_proxies = [p for p in self.proxy_list if p != old_proxy]
-            if available_proxies:
-                new_proxy = random.choice(available_proxies)
-                self.logger.warning(f"Proxy {old_proxy} failed, retrying with {new_proxy}")
-                request.meta["proxy"] = new_proxy
-                return request
-        return None
\ No newline at end of file
+        old_proxy = request.meta.get('proxy')
+        if not (old_proxy and request.meta.get("proxy_from_pool")):
+            return None
+
+        self.pool.record_failure(old_proxy)
+        self.stats.inc_value("proxy_pool/failure_count")
+        self.update_stats()
+
+        retries = request.meta.get("proxy_retry_times", 0)
+        if len(self.pool) > 1 and retries < self.max_retries:
+            new_proxy = self.pool.get(session=self.session_key(request), exclude=old_proxy)
+            self.logger.warning(f"Proxy {proxy_label(old_proxy)} failed ({exception!r}), retrying with {proxy_label(new_proxy)}")
+            retry = request.replace(dont_filter=True)
+            retry.meta["proxy"] = new_proxy
+            retry.meta["proxy_assigned"] = True
+            retry.meta["proxy_retry_times"] = retries + 1
+            self.assign_slot(retry, new_proxy)
+            return retry
+        return None
+
+    def update_stats(self):
+        available = len(self.pool.available())
+        self.stats.set_value("proxy_pool/size", len(self.pool))
+        self.stats.set_value("proxy_pool/available", available)
+
+        if self.slots_enabled and self.crawler and self.crawler.engine:
+            # total concurrency follows the number of healthy proxies
+            concurrency = min(self.max_concurrency, max(self.base_concurrency, available * self.slot_concurrency))
+            self.crawler.engine.downloader.total_concurrency = concurrency + self.extra_concurrency
+            self.stats.set_value("proxy_pool/total_concurrency", concurrency)
+
+    def spider_closed(self, spider):
+        if self.pool:
+            for key, value in self.pool.stats().items():
+                self.stats.set_value(key, value)
+
+
+class BlockDetectionMiddleware:
+    """Keeps ban and captcha pages away from the spider and slows down the slot that got them.
+
+    Responses from the spider's allowed domains are classified by
+    ResponseClassifier. For a blocked or captcha response the
+    `response_blocked` signal is sent (ProxyMiddleware cools the proxy
+    down), the delay of the request's download slot is raised to
+    BLOCK_BACKOFF_DELAY and doubled on every further block up to
+    BLOCK_MAX_DELAY (or to Retry-After), and the request is scheduled
+    again. After BLOCK_MAX_RETRIES blocks the request is dropped. Without
+    AutoThrottle, which already adapts slot delays, the extra delay decays
+    again with every successful response.
+    """
+
+    def __init__(self, crawler, classifier, max_retries, backoff_delay, max_delay):
+        self.logger = logging.getLogger(__name__)
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.classifier = classifier
+        self.max_retries = max_retries
+        self.backoff_delay = backoff_delay
+        self.max_delay = max_delay
+        self.recover = not crawler.settings.getbool("AUTOTHROTTLE_ENABLED")
+        # slot key -> delay before the first block
+        self.base_delays = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler,
+            blocks.ResponseClassifier.from_settings(settings),
+            settings.getint("BLOCK_MAX_RETRIES"),
+            settings.getfloat("BLOCK_BACKOFF_DELAY"),
+            settings.getfloat("BLOCK_MAX_DELAY"),
+        )
+
+    def process_response(self, request, response, spider):
+        if not self.is_site_url(response.url, spider):
+            return response
+
+        kind = self.classifier.classify(response)
+        self.stats.inc_value(f"blocks/{kind}")
+        if kind in (blocks.OK, blocks.NOT_FOUND):
+            self.relax(request)
+            return response
+
+        self.crawler.signals.send_catch_log(
+            signal=response_blocked, request=request, response=response, kind=kind, spider=spider
+        )
+        delay = self.back_off(request, response)
+
+        retries = request.meta.get("block_retry_times", 0) + 1
+        if retries > self.max_retries:
+            self.stats.inc_value("blocks/gave_up")
+            self.logger.error(f"Giving up on {request.url} after {self.max_retries} {kind} responses")
+            raise IgnoreRequest(f"{kind} response for {request.url}")
+
+        self.logger.info(f"{kind.capitalize()} response ({response.status}) for {request.url}, "
+                         f"retry {retries}/{self.max_retries}, slot delay {delay:.1f}s")
+        self.stats.inc_value("blocks/rescheduled")
+        # start over from the original URL if the block page was reached through a redirect
+        retry = request.replace(url=request.meta.get("redirect_urls", [request.url])[0], dont_filter=True)
+        retry.meta["block_retry_times"] = retries
+        for key in ("redirect_urls", "redirect_reasons", "redirect_times", "redirect_ttl"):
+            retry.meta.pop(key, None)
+        return retry
+
+    def is_site_url(self, url, spider):
+        # by hostname, base_url crawls against a local server have a port in the netloc
+        host = (urlparse(url).hostname or "").lower()
+        return any(host == domain or host.endswith(f".{domain}") for domain in getattr(spider, "allowed_domains", None) or [])
+
+    def slot(self, request):
+        downloader = self.crawler.engine.downloader
+        key = downloader.get_slot_key(request)
+        return key, downloader.slots.get(key)
+
+    def retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        try:
+            return float(value) if value else 0.0
+        except ValueError:
+            # HTTP-date form, not worth parsing
+            return 0.0
+
+    def back_off(self, request, response):
+        key, slot = self.slot(request)
+        if slot is None:
+            return 0.0
+        self.base_delays.setdefault(key, slot.delay)
+        delay = max(self.backoff_delay, slot.delay * 2, self.retry_after(response))
+        slot.delay = min(delay, self.max_delay)
+        return slot.delay
+
+    def relax(self, request):
+        if not self.recover or not self.base_delays:
+            return
+        key, slot = self.slot(request)
+        if key not in self.base_delays:
+            return
+        if slot is None:
+            del self.base_delays[key]
+            return
+        slot.delay = max(self.base_delays[key], slot.delay * 0.9)
+        if slot.delay <= self.base_delays[key]:
+            del self.base_delays[key]
+
+
+class IncrementalSpiderMiddleware:
+    """Skips company profiles that were already crawled within INCREMENTAL_MAX_AGE seconds.
+
+    Applies to callback output and to the profile requests the spider starts
+    with from its discovery cache.
+    """
+
+    def __init__(self, store, max_age, stats):
+        self.logger = logging.getLogger(__name__)
+        self.store = store
+        self.max_age = max_age
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_ENABLED"):
+            raise NotConfigured
+        store = FingerprintStore(crawler.settings.get("INCREMENTAL_DB"))
+        s = cls(store, crawler.settings.getint("INCREMENTAL_MAX_AGE"), crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def skip(self, i, since):
+        # review pages belong to a profile that was already let through
+        if isinstance(i, Request) and is_company_url(i.url) and "review_page" not in i.meta:
+            if self.store.seen_since(normalize_company_url(i.url), since):
+                self.logger.debug(f"Skipping recently crawled profile: {i.url}")
+                self.stats.inc_value("incremental/skipped_requests")
+                return True
+        return False
+
+    async def process_start(self, start):
+        since = time.time() - self.max_age
+        async for i in start:
+            if not self.skip(i, since):
+                yield i
+
+    def process_spider_output(self, response, result, spider):
+        since = time.time() - self.max_age
+        for i in result:
+            if not self.skip(i, since):
+                yield i
+
+    async def process_spider_output_async(self, response, result, spider):
+        since = time.time() - self.max_age
+        async for i in result:
+            if not self.skip(i, since):
+                yield i
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+
+class CompanyDedupSpiderMiddleware:
+    """Drops duplicate company profile requests before they are scheduled.
+
+    Company URLs are canonicalized and kept in a SeenUrlStore, which persists
+    across runs when COMPANY_DEDUP_DB points to a file (or in the job directory
+    of a JOBDIR crawl). A company counts as seen if it was seen in this run or
+    within INCREMENTAL_MAX_AGE, so a persistent store does not keep it from
+    being crawled again later. Every listing a company was found in is
+    recorded and attached to the item in `listed_in`; a listing crawled after
+    the item was passed on yields a CompanyListingsItem with the complete
+    `listed_in`. Profile requests the spider starts with from its discovery
+    cache are handled the same way.
+    """
+
+    def __init__(self, store, max_age, stats):
+        self.store = store
+        self.max_age = max_age
+        self.stats = stats
+        self.started = time.time()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("COMPANY_DEDUP_DB") or state_path(crawler.settings, "companies_seen.db")
+        store = SeenUrlStore(path or ":memory:")
+        s = cls(store, crawler.settings.getint("INCREMENTAL_MAX_AGE"), crawler.stats)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def since(self):
+        """Entries older than this belong to an earlier crawl."""
+        return min(self.started, time.time() - self.max_age)
+
+    def listed_in(self, url, since):
+        return [f"{category}/{subcategory}" for category, subcategory in self.store.memberships(url, since)]
+
+    def process(self, i):
+        """The request or item to pass on, or None for a duplicate profile request."""
+        if isinstance(i, Request) and is_company_url(i.url) and "review_page" not in i.meta:
+            url = normalize_company_url(i.url)
+            since = self.since()
+            new_listing = self.store.add_membership(url, i.meta.get('category_name'), i.meta.get('subcategory'), since)
+            if not self.store.add(url, since):
+                self.stats.inc_value("dedup/filtered_requests")
+                if new_listing and self.store.emitted_since(url, since):
+                    # the company's item went out before this listing was crawled
+                    self.stats.inc_value("dedup/late_listings")
+                    return CompanyListingsItem(trustpilot_url=url, listed_in=self.listed_in(url, since))
+                return None
+            if i.url != url:
+                i = i.replace(url=url)
+        elif isinstance(i, TrustpilotScraperItem):
+            url = normalize_company_url(i['trustpilot_url'])
+            i['listed_in'] = self.listed_in(url, self.since())
+            self.store.mark_emitted(url)
+        return i
+
+    async def process_start(self, start):
+        async for i in start:
+            if (i := self.process(i)) is not None:
+                yield i
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            if (i := self.process(i)) is not None:
+                yield i
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for i in result:
+            if (i := self.process(i)) is not None:
+                yield i
+
+    def spider_closed(self, spider):
+        self.store.close()
+
+
+class FrontierSpiderMiddleware:
+    """Holds back pagination requests while the scheduler queue is too long.
+
+    Pagination requests (those with a "page" or "review_page" meta key) are
+    parked while more than FRONTIER_MAX_PENDING requests wait in the scheduler
+    and released as the queue drains. Each subcategory and each company has at
+    most one pending next page, so the parked list stays bounded by the number
+    of subcategories and companies in flight. On JOBDIR
+    crawls the parked requests are checkpointed into the job directory.
+    Disabled on shared queue crawls, where the queue is not in the worker's
+    memory and the local enqueued/dequeued counts say nothing about its length.
+    """
+
+    def __init__(self, crawler, max_pending):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_pending = max_pending
+        self.parked = deque()
+        self.state_file = state_path(crawler.settings, "frontier.state")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        max_pending = crawler.settings.getint("FRONTIER_MAX_PENDING")
+        if max_pending <= 0 or crawler.settings.get("SHARED_QUEUE_URI"):
+            raise NotConfigured
+        s = cls(crawler, max_pending)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(s.save_state, signal=checkpoint)
+        return s
+
+    def spider_opened(self, spider):
+        for data in read_state(self.state_file, []):
+            self.parked.append(request_from_dict(data, spider=spider))
+        if self.parked:
+            spider.logger.info(f"Restored {len(self.parked)} parked pagination requests")
+
+    def save_state(self):
+        if self.state_file:
+            spider = self.crawler.spider
+            write_state(self.state_file, [request.to_dict(spider=spider) for request in self.parked])
+
+    def spider_closed(self, spider):
+        self.save_state()
+
+    def pending(self):
+        return self.stats.get_value("scheduler/enqueued", 0) - self.stats.get_value("scheduler/dequeued", 0)
+
+    def park(self, i):
+        """Parks a pagination request while the queue is full, returns whether it was parked."""
+        if isinstance(i, Request) and ("page" in i.meta or "review_page" in i.meta) and self.pending() >= self.max_pending:
+            self.parked.append(i)
+            self.stats.inc_value("frontier/parked")
+            return True
+        return False
+
+    def process_spider_output(self, response, result, spider):
+        for i in result:
+            if not self.park(i):
+                yield i
+        self.release()
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for i in result:
+            if not self.park(i):
+                yield i
+        self.release()
+
+    def release(self):
+        while self.parked and self.pending() < self.max_pending:
+            self.crawler.engine.crawl(self.parked.popleft())
+            self.stats.inc_value("frontier/released")
+
+    def spider_idle(self, spider):
+        if self.parked:
+            self.release()
+            raise DontCloseSpider
+
+
+class CallbackTimingMiddleware:
+    """Records wall and CPU time of every spider callback (INSTRUMENTATION_ENABLED).
+
+    Sits next to the spider so that only the time spent inside the callback
+    generator is measured, not the other middlewares and the scheduler.
+    """
+
+    def __init__(self, metrics):
+        self.wall = metrics.histogram("callback_wall_seconds", "Wall time spent in spider callbacks")
+        self.cpu = metrics.histogram("callback_cpu_seconds", "CPU time spent in spider callbacks")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INSTRUMENTATION_ENABLED"):
+            raise NotConfigured
+        return cls(metrics_for(crawler))
+
+    def callback_name(self, response):
+        callback = response.request.callback if response.request else None
+        return getattr(callback, "__name__", "parse")
+
+    def process_spider_output(self, response, result, spider):
+        wall = cpu = 0.0
+        iterator = iter(result)
+        while True:
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            try:
+                i = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                wall += time.perf_counter() - start
+                cpu += time.thread_time() - start_cpu
+            yield i
+        self.observe(response, wall, cpu)
+
+    async def process_spider_output_async(self, response, result, spider):
+        wall = cpu = 0.0
+        iterator = result.__aiter__()
+        while True:
+            start, start_cpu = time.perf_counter(), time.thread_time()
+            try:
+                i = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                wall += time.perf_counter() - start
+                cpu += time.thread_time() - start_cpu
+            yield i
+        self.observe(response, wall, cpu)
+
+    def observe(self, response, wall, cpu):
+        callback = self.callback_name(response)
+        self.wall.observe(wall, callback=callback)
+        self.cpu.observe(cpu, callback=callback)
+
+
+class FixtureRecorderMiddleware:
+    """Saves category, listing and profile pages as fixtures for the offline benchmarks.
+
+    Enabled by FIXTURE_RECORD_DIR. Pages are written to categories/, listings/,
+    profiles/ and reviews/ below that directory, and index.json maps each request
+    path (with query string) to its file, which is what
+    benchmarks/fixture_server.py --replay serves. Recording into an existing
+    directory adds to its index.
+    """
+
+    def __init__(self, record_dir):
+        self.logger = logging.getLogger(__name__)
+        self.record_dir = record_dir
+        self.index_file = os.path.join(record_dir, "index.json")
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        record_dir = crawler.settings.get("FIXTURE_RECORD_DIR")
+        if not record_dir:
+            raise NotConfigured
+        s = cls(record_dir)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def fixture_name(self, url):
+        """(kind, file name) of a page worth recording, or None."""
+        parsed = urlparse(url)
+        path = parsed.path.rstrip('/')
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        if path == '/categories':
+            return "categories", f"categories-{query.get('country', 'all')}.html"
+        if path.startswith('/categories/'):
+            return "listings", f"{path.split('/')[2]}-p{query.get('page', '1')}.html"
+        if is_company_url(url):
+            if query.get('page', '1') != '1':
+                return "reviews", f"{path.split('/')[2]}-p{query['page']}.html"
+            return "profiles", f"{path.split('/')[2]}.html"
+        return None
+
+    def process_response(self, request, response, spider):
+        if response.status != 200:
+            return response
+        name = self.fixture_name(response.url)
+        if name is None:
+            return response
+
+        kind, filename = name
+        filename = re.sub(r'[^\w.\-]', '_', filename)
+        os.makedirs(os.path.join(self.record_dir, kind), exist_ok=True)
+        with open(os.path.join(self.record_dir, kind, filename), "wb") as f:
+            f.write(response.body)
+
+        parsed = urlparse(response.url)
+        key = f"{parsed.path}?{parsed.query}" if parsed.query else parsed.path
+        self.index[key] = {
+            "file": f"{kind}/{filename}",
+            "content_type": response.headers.get("Content-Type", b"text/html").decode("latin-1"),
+        }
+        return response
+
+    def spider_closed(self, spider):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.index_file)
+        self.logger.info(f"Recorded {len(self.index)} fixtures to {self.record_dir}")
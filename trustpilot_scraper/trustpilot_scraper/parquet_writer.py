@@ -0,0 +1,129 @@
+# Partitioned Parquet output for ParquetExportPipeline (needs the optional pyarrow dependency)
+
+import os
+import socket
+import time
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from trustpilot_scraper.utils import to_float, to_int
+
+PARTITION_COLUMNS = ("country", "category")
+# partition directories for items without a country/category, same as Hive and pyarrow
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def item_schema():
+    """Arrow schema of TrustpilotScraperItem, without the partition columns."""
+    return pa.schema([
+        ("company_name", pa.string()),
+        ("subcategory", pa.string()),
+        ("avg_review_score", pa.float64()),
+        ("review_count", pa.int64()),
+        ("address", pa.string()),
+        ("website", pa.string()),
+        ("email", pa.string()),
+        ("phone", pa.string()),
+        ("trustpilot_url", pa.string()),
+        ("listed_in", pa.list_(pa.string())),
+    ])
+
+
+CONVERTERS = {
+    "avg_review_score": to_float,
+    "review_count": to_int,
+}
+
+
+class PartitionedParquetWriter:
+    """Buffers items per country/category partition and writes them as row groups.
+
+    Files are laid out Hive style, `<base>/country=GB/category=<name>/part-*.parquet`,
+    and every file name carries the host and pid so that any number of crawler
+    processes can write into the same directory. A partition's buffer is written
+    as one row group once it holds `row_group_size` rows; when all partitions
+    together hold more than `max_buffered_rows`, the largest buffers are written
+    early. roll() closes the open files, a file is only renamed to *.parquet
+    once its footer is written.
+    """
+
+    def __init__(self, base_dir, row_group_size=10_000, max_buffered_rows=50_000, compression="zstd"):
+        self.base_dir = base_dir
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.compression = compression
+        self.schema = item_schema()
+        self.columns = self.schema.names
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.writers = {}
+        self.prefix = f"part-{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self.sequence = 0
+        self.rows_written = 0
+        self.row_groups = 0
+        self.files = 0
+
+    def partition(self, item):
+        return tuple(item.get(column) or None for column in PARTITION_COLUMNS)
+
+    def add(self, item):
+        key = self.partition(item)
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = {column: [] for column in self.columns}
+        for column in self.columns:
+            value = item.get(column)
+            converter = CONVERTERS.get(column)
+            buffer[column].append(converter(value) if converter else value)
+        self.buffered_rows += 1
+
+        if len(buffer["trustpilot_url"]) >= self.row_group_size:
+            self.flush(key)
+        elif self.buffered_rows > self.max_buffered_rows:
+            for key in sorted(self.buffers, key=lambda k: len(self.buffers[k]["trustpilot_url"]), reverse=True):
+                self.flush(key)
+                if self.buffered_rows <= self.max_buffered_rows // 2:
+                    break
+
+    def flush(self, key):
+        buffer = self.buffers.pop(key, None)
+        if not buffer or not buffer["trustpilot_url"]:
+            return
+        rows = len(buffer["trustpilot_url"])
+        table = pa.Table.from_pydict(buffer, schema=self.schema)
+        self.writer(key).write_table(table, row_group_size=rows)
+        self.buffered_rows -= rows
+        self.rows_written += rows
+        self.row_groups += 1
+
+    def writer(self, key):
+        writer = self.writers.get(key)
+        if writer is None:
+            directory = os.path.join(self.base_dir, *(
+                f"{column}={quote(str(value), safe='') if value else DEFAULT_PARTITION}"
+                for column, value in zip(PARTITION_COLUMNS, key)
+            ))
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{self.prefix}-{self.sequence:05d}.parquet")
+            writer = pq.ParquetWriter(f"{path}.inprogress", self.schema, compression=self.compression)
+            self.writers[key] = writer
+        return writer
+
+    def roll(self):
+        """Writes all buffers and closes the current files; later rows go to new files."""
+        for key in list(self.buffers):
+            self.flush(key)
+        for writer in self.writers.values():
+            writer.close()
+            os.replace(writer.where, writer.where[:-len(".inprogress")])
+            self.files += 1
+        self.writers = {}
+        self.sequence += 1
+
+    def close(self):
+        self.roll()
@@ -6,8 +6,26 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
-from scrapy.exceptions import DropItem
+from scrapy.exceptions import DropItem, NotConfigured
+import json
 import logging
+import os
+import time
+from urllib.parse import urljoin, urlparse
+
+from scrapy import Request
+from scrapy.http import TextResponse
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from twisted.internet.defer import Deferred, DeferredSemaphore, succeed
+from twisted.internet.threads import deferToThread
+
+from trustpilot_scraper import parquet_writer
+from trustpilot_scraper.contacts import extract_contacts
+from trustpilot_scraper.items import CompanyListingsItem, TrustpilotScraperItem
+from trustpilot_scraper.membership import ExactSet, load_membership, make_membership
+from trustpilot_scraper.storage import FingerprintStore, item_fingerprint, open_company_sink
+from trustpilot_scraper.signals import checkpoint
+from trustpilot_scraper.utils import normalize_company_url, read_state, state_path, to_float, to_int, write_state
 
 
 class TrustpilotScraperPipeline:
@@ -16,35 +34,412 @@ class TrustpilotScraperPipeline:
 
 
 class DuplicateFilterPipeline:
-    def __init__(self):
-        self.urls_seen = set()
+    def __init__(self, urls_seen=None, state_file=None):
+        # any backend from trustpilot_scraper.membership, selected by DEDUP_BACKEND
+        self.urls_seen = urls_seen if urls_seen is not None else ExactSet()
+        self.state_file = state_file
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        # resumable (JOBDIR) crawls checkpoint the seen URLs into the job directory
+        state_file = crawler.settings.get("DEDUP_STATE_FILE") or state_path(crawler.settings, "dedup.state")
+        if state_file and os.path.exists(state_file):
+            urls_seen = load_membership(state_file)
+        else:
+            urls_seen = make_membership(crawler.settings)
+        pipeline = cls(urls_seen, state_file)
+        crawler.signals.connect(pipeline.save_state, signal=checkpoint)
+        return pipeline
+
+    def save_state(self):
+        if self.state_file:
+            self.urls_seen.dump(f"{self.state_file}.tmp")
+            os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    def close_spider(self, spider):
+        self.save_state()
+
+    def process_item(self, item, spider):
+        # reviews go their own way, see ReviewItem
+        if not isinstance(item, TrustpilotScraperItem):
+            return item
+        unique_url = normalize_company_url(item['trustpilot_url'])
+
+        if unique_url in self.urls_seen:
+            raise DropItem(f"Duplicate data removed: {item['company_name']}")
+        else:
+            self.urls_seen.add(unique_url)
+            return item
+
+
+class IncrementalPipeline:
+    """Drops items whose content has not changed since the previous crawl."""
+
+    def __init__(self, db_path, stats):
+        self.db_path = db_path
+        self.stats = stats
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("INCREMENTAL_ENABLED"):
+            raise NotConfigured
+        return cls(crawler.settings.get("INCREMENTAL_DB"), crawler.stats)
+
+    def open_spider(self, spider):
+        self.store = FingerprintStore(self.db_path)
+
+    def close_spider(self, spider):
+        self.store.close()
+
+    def process_item(self, item, spider):
+        if not isinstance(item, TrustpilotScraperItem):
+            return item
+        url = normalize_company_url(item['trustpilot_url'])
+        content_hash = item_fingerprint(item)
+        previous = self.store.get(url)
+        self.store.update(url, content_hash)
+
+        if previous and previous[0] == content_hash:
+            self.stats.inc_value("incremental/unchanged_items")
+            raise DropItem(f"Unchanged since last crawl: {item['company_name']}")
+        return item
+
+
+class ContactEnrichmentPipeline:
+    """Fills in a missing email or phone from the company's own website.
+
+    Enabled by ENRICH_ENABLED. The pages in ENRICH_PATHS (home, /contact,
+    /impressum) are fetched one after the other until both an email and a
+    phone were found. Downloads go through the engine, so proxies, retries
+    and the HTTP cache apply, but each website gets its own "enrich:<host>"
+    download slot with the usual DOWNLOAD_DELAY, and at most
+    ENRICH_CONCURRENCY websites are visited at a time, on top of
+    CONCURRENT_REQUESTS. Results are cached per host.
+
+    A waiting item keeps its profile response in the scraper, which stops
+    taking new responses once they add up to SCRAPER_SLOT_MAX_ACTIVE_SIZE
+    bytes. Items are therefore passed on unenriched when more than
+    ENRICH_MAX_PENDING of them wait for a website or the scraper already
+    holds ENRICH_MAX_ACTIVE_SIZE bytes of responses, so enrichment never
+    holds back the crawl.
+    """
+
+    def __init__(self, crawler):
+        self.logger = logging.getLogger(__name__)
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.paths = settings.getlist("ENRICH_PATHS")
+        self.concurrency = settings.getint("ENRICH_CONCURRENCY")
+        self.max_pending = settings.getint("ENRICH_MAX_PENDING")
+        self.max_active_size = settings.getint("ENRICH_MAX_ACTIVE_SIZE")
+        self.timeout = settings.getfloat("ENRICH_TIMEOUT")
+        self.maxsize = settings.getint("ENRICH_MAXSIZE")
+        self.semaphore = DeferredSemaphore(self.concurrency)
+        # host -> (email, phone), and the items waiting for a host being visited
+        self.cache = {}
+        self.waiting = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("ENRICH_ENABLED"):
+            raise NotConfigured
+        return cls(crawler)
+
+    def open_spider(self, spider):
+        # website downloads have their own budget, the crawl keeps CONCURRENT_REQUESTS
+        self.crawler.engine.downloader.total_concurrency += self.concurrency
+
+    async def process_item(self, item, spider):
+        if not isinstance(item, TrustpilotScraperItem):
+            return item
+        website = item.get('website')
+        if not website or (item.get('email') and item.get('phone')):
+            return item
+        host = urlparse(website).netloc.lower().removeprefix("www.")
+        if not host:
+            return item
+
+        if host in self.cache:
+            self.stats.inc_value("enrich/cache_hits")
+            email, phone = self.cache[host]
+        elif len(self.semaphore.waiting) >= self.max_pending or self.scraper_full():
+            self.stats.inc_value("enrich/skipped_busy")
+            return item
+        elif host in self.waiting:
+            d = Deferred()
+            self.waiting[host].append(d)
+            email, phone = await maybe_deferred_to_future(d)
+        else:
+            self.waiting[host] = []
+            try:
+                email, phone = await maybe_deferred_to_future(self.semaphore.run(self.visit, host, website))
+            except Exception as e:
+                self.logger.error(f"Contact enrichment of {host} failed: {e}", exc_info=True)
+                email = phone = None
+            self.cache[host] = email, phone
+            for d in self.waiting.pop(host):
+                d.callback((email, phone))
+
+        self.stats.inc_value("enrich/items")
+        if email and not item.get('email'):
+            item['email'] = email
+            self.stats.inc_value("enrich/emails_found")
+        if phone and not item.get('phone'):
+            item['phone'] = phone
+            self.stats.inc_value("enrich/phones_found")
+        return item
+
+    def scraper_full(self):
+        slot = self.crawler.engine.scraper.slot
+        return slot is not None and slot.active_size >= self.max_active_size
+
+    def visit(self, host, website):
+        return deferred_from_coro(self.fetch_contacts(host, website))
 
-        def process_item(self, item, spider):
-            unique_url = item['trustpilot_url'].strip().rstrip("/")
+    async def fetch_contacts(self, host, website):
+        email = phone = None
+        for path in self.paths:
+            request = Request(
+                urljoin(website, path),
+                meta={
+                    "download_slot": f"enrich:{host}",
+                    "download_timeout": self.timeout,
+                    "download_maxsize": self.maxsize,
+                    "max_retry_times": 1,
+                },
+                dont_filter=True,
+            )
+            try:
+                response = await maybe_deferred_to_future(self.crawler.engine.download(request))
+            except Exception as e:
+                # an unreachable website is not tried again with the next path
+                self.stats.inc_value("enrich/errors")
+                self.logger.debug(f"Contact enrichment of {host} failed on {request.url}: {e}")
+                break
+            self.stats.inc_value("enrich/pages")
+            if response.status != 200 or not isinstance(response, TextResponse):
+                continue
+            found_email, found_phone = extract_contacts(response.body)
+            email, phone = email or found_email, phone or found_phone
+            if email and phone:
+                break
+        return email, phone
+
+
+class ParquetExportPipeline:
+    """Writes items as typed Parquet row groups partitioned by country/category.
+
+    Enabled by PARQUET_DIR. Resumable crawls close their files at every
+    checkpoint, so only complete Parquet files are left behind after a kill.
+    """
+
+    def __init__(self, writer, stats):
+        self.writer = writer
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.get("PARQUET_DIR"):
+            raise NotConfigured
+        if parquet_writer.pa is None:
+            raise NotConfigured("PARQUET_DIR is set but pyarrow is not installed (pip install .[parquet])")
+        writer = parquet_writer.PartitionedParquetWriter(
+            settings.get("PARQUET_DIR"),
+            row_group_size=settings.getint("PARQUET_ROW_GROUP_SIZE"),
+            max_buffered_rows=settings.getint("PARQUET_MAX_BUFFERED_ROWS"),
+            compression=settings.get("PARQUET_COMPRESSION"),
+        )
+        pipeline = cls(writer, crawler.stats)
+        crawler.signals.connect(pipeline.roll, signal=checkpoint)
+        return pipeline
+
+    def process_item(self, item, spider):
+        if not isinstance(item, TrustpilotScraperItem):
+            return item
+        self.writer.add(ItemAdapter(item))
+        return item
+
+    def roll(self):
+        self.writer.roll()
+        self.update_stats()
+
+    def update_stats(self):
+        self.stats.set_value("parquet/rows_written", self.writer.rows_written)
+        self.stats.set_value("parquet/row_groups", self.writer.row_groups)
+        self.stats.set_value("parquet/files", self.writer.files)
+
+    def close_spider(self, spider):
+        self.writer.close()
+        self.update_stats()
+
+
+class DatabaseSinkPipeline:
+    """Bulk-upserts items into SQLite or PostgreSQL, keyed on the canonical trustpilot_url.
+
+    Items are collected into batches of DB_SINK_BATCH_SIZE and written one
+    batch at a time in the reactor's thread pool. When more than
+    DB_SINK_MAX_PENDING_BATCHES batches wait for the database, items are held
+    back until the writer catches up, so a slow database throttles the crawl
+    instead of growing memory. Changes of avg_review_score/review_count are
+    recorded in the company_history table. A CompanyListingsItem replaces the
+    `listed_in` of its company's row.
+    """
+
+    def __init__(self, sink, batch_size, max_pending_batches, stats):
+        self.logger = logging.getLogger(__name__)
+        self.sink = sink
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches
+        self.stats = stats
+        self.batch = []
+        self.queue = []
+        self.writing = None
+        self.waiting = []
+        self.idle = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        uri = settings.get("DB_SINK_URI")
+        if not uri:
+            raise NotConfigured
+        try:
+            sink = open_company_sink(uri)
+        except ImportError:
+            raise NotConfigured("DB_SINK_URI points to PostgreSQL but psycopg is not installed (pip install .[postgres])")
+        pipeline = cls(
+            sink,
+            settings.getint("DB_SINK_BATCH_SIZE"),
+            settings.getint("DB_SINK_MAX_PENDING_BATCHES"),
+            crawler.stats,
+        )
+        crawler.signals.connect(pipeline.flush, signal=checkpoint)
+        return pipeline
+
+    def row(self, adapter):
+        listed_in = adapter.get('listed_in')
+        return {
+            "trustpilot_url": normalize_company_url(adapter.get('trustpilot_url')),
+            "company_name": adapter.get('company_name'),
+            "country": adapter.get('country'),
+            "category": adapter.get('category'),
+            "subcategory": adapter.get('subcategory'),
+            "avg_review_score": to_float(adapter.get('avg_review_score')),
+            "review_count": to_int(adapter.get('review_count')),
+            "website": adapter.get('website'),
+            "email": adapter.get('email'),
+            "phone": adapter.get('phone'),
+            "address": adapter.get('address'),
+            "listed_in": json.dumps(listed_in) if listed_in else None,
+            "seen_at": time.time(),
+        }
+
+    def process_item(self, item, spider):
+        if isinstance(item, CompanyListingsItem):
+            self.batch.append({
+                "trustpilot_url": normalize_company_url(item['trustpilot_url']),
+                "listed_in": json.dumps(item['listed_in']),
+            })
+        elif isinstance(item, TrustpilotScraperItem):
+            self.batch.append(self.row(ItemAdapter(item)))
+        else:
+            return item
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+        if len(self.queue) >= self.max_pending_batches:
+            # backpressure: the item completes once the writer has caught up
+            d = Deferred()
+            self.waiting.append(d)
+            d.addCallback(lambda _: item)
+            return d
+        return item
+
+    def flush(self):
+        """Queues the current batch for writing."""
+        if self.batch:
+            self.queue.append(self.batch)
+            self.batch = []
+        self.write_next()
+
+    def write_next(self):
+        if self.writing is not None or not self.queue:
+            return
+        batch = self.queue.pop(0)
+        self.writing = deferToThread(self.sink.write, batch)
+        self.writing.addCallbacks(self.written, self.write_failed, callbackArgs=(batch,), errbackArgs=(batch,))
+        self.writing.addBoth(self.batch_done)
+
+    def written(self, history_rows, batch):
+        self.stats.inc_value("db_sink/batches")
+        self.stats.inc_value("db_sink/rows_written", len(batch))
+        self.stats.inc_value("db_sink/history_rows", history_rows)
+
+    def write_failed(self, failure, batch):
+        self.stats.inc_value("db_sink/failed_rows", len(batch))
+        self.logger.error(f"Failed to write {len(batch)} rows to the database: {failure.getErrorMessage()}")
+
+    def batch_done(self, _):
+        self.writing = None
+        waiting, self.waiting = self.waiting, []
+        for d in waiting:
+            d.callback(None)
+        self.write_next()
+        if self.writing is None:
+            idle, self.idle = self.idle, []
+            for d in idle:
+                d.callback(None)
+
+    def close_spider(self, spider):
+        self.flush()
+        if self.writing is None:
+            done = succeed(None)
+        else:
+            done = Deferred()
+            self.idle.append(done)
+        done.addCallback(lambda _: self.sink.close())
+        return done
 
-            if unique_url in self.urls_seen:
-                raise DropItem(f"Duplicate data removed: {item['company_name']}")
-            else:
-                self.urls_seen.add(unique_url)
-                return item
-                
 
 class DescribeItemPipeline:
     """A pipeline that describes unique items."""
-    def __init__(self) -> None:
-        self.categories = set()
-        self.subcategories = set()
+    def __init__(self, state_file=None, stats=None) -> None:
+        self.state_file = state_file
+        self.stats = stats
+        self.categories, self.subcategories = read_state(state_file, (set(), set()))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls(state_path(crawler.settings, "describe.state"), crawler.stats)
+        crawler.signals.connect(pipeline.save_state, signal=checkpoint)
+        return pipeline
+
+    def save_state(self):
+        if self.state_file:
+            write_state(self.state_file, (self.categories, self.subcategories))
 
     def process_item(self, item, spider):
         category = item.get('category')
         subcategory = item.get('subcategory')
-        if category:
+        if category and category not in self.categories:
             self.categories.add(category)
-        if subcategory:
+            self.update_stats()
+        if subcategory and subcategory not in self.subcategories:
             self.subcategories.add(subcategory)
+            self.update_stats()
         return item
+
+    def update_stats(self):
+        # running counts, picked up by the instrumentation exports
+        if self.stats:
+            self.stats.set_value("describe/unique_categories", len(self.categories))
+            self.stats.set_value("describe/unique_subcategories", len(self.subcategories))
     
     def close_spider(self, spider):
+        self.save_state()
         logging.info("------- SCRAPING SUMMARY -------")
         logging.info(f"Total unique categories scraped: {len(self.categories)}")
         logging.info(f"Categories: {self.categories}")
@@ -0,0 +1,135 @@
+# Health-scored proxy pool used by ProxyMiddleware
+
+import random
+import time
+from urllib.parse import urlparse
+
+
+def proxy_label(proxy):
+    """host:port of a proxy URL, without credentials, for logs and stats."""
+    parsed = urlparse(proxy if "://" in proxy else f"http://{proxy}")
+    return f"{parsed.hostname}:{parsed.port}" if parsed.port else str(parsed.hostname)
+
+
+class ProxyState:
+    """Health of a single proxy: smoothed latency and success rate plus cooldown."""
+
+    def __init__(self, url, alpha):
+        self.url = url
+        self.label = proxy_label(url)
+        self.alpha = alpha
+        self.requests = 0
+        self.failures = 0
+        self.bans = 0
+        self.consecutive_failures = 0
+        self.success_rate = 1.0
+        self.latency = None
+        self.cooldown_until = 0.0
+
+    def available(self, now):
+        return self.cooldown_until <= now
+
+    def score(self, default_latency):
+        latency = self.latency if self.latency is not None else default_latency
+        return self.success_rate ** 2 / max(latency, 0.05)
+
+    def record(self, ok, latency=None):
+        self.requests += 1
+        self.success_rate += self.alpha * ((1.0 if ok else 0.0) - self.success_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+
+class ProxyPool:
+    """Picks proxies by a weighted health score and cools down failing or banned ones.
+
+    A proxy's score is success_rate**2 / latency, both smoothed with an EWMA.
+    Transport failures put a proxy on an exponentially growing cooldown, ban
+    signals (403/429, captcha pages) on a longer one. With `sticky` enabled
+    each session key keeps its proxy for as long as the proxy stays available.
+    """
+
+    def __init__(self, proxies, cooldown=30, max_cooldown=1800, ban_cooldown=600, alpha=0.3, sticky=False):
+        self.states = {url: ProxyState(url, alpha) for url in dict.fromkeys(proxies)}
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.ban_cooldown = ban_cooldown
+        self.sticky = sticky
+        self.sessions = {}
+
+    def __len__(self):
+        return len(self.states)
+
+    def __bool__(self):
+        return bool(self.states)
+
+    def available(self, now=None):
+        now = now or time.time()
+        return [s for s in self.states.values() if s.available(now)]
+
+    def _default_latency(self):
+        latencies = [s.latency for s in self.states.values() if s.latency is not None]
+        return sum(latencies) / len(latencies) if latencies else 1.0
+
+    def get(self, session=None, exclude=None):
+        """Returns the proxy URL to use, or None for an empty pool."""
+        if not self.states:
+            return None
+        now = time.time()
+
+        if self.sticky and session is not None:
+            pinned = self.states.get(self.sessions.get(session))
+            if pinned and pinned.available(now) and pinned.url != exclude:
+                return pinned.url
+
+        candidates = [s for s in self.states.values() if s.available(now) and s.url != exclude]
+        if candidates:
+            default_latency = self._default_latency()
+            weights = [s.score(default_latency) for s in candidates]
+            state = random.choices(candidates, weights=weights)[0]
+        else:
+            # everything is cooling down: use the proxy that recovers first
+            state = min(self.states.values(), key=lambda s: s.cooldown_until)
+
+        if self.sticky and session is not None:
+            self.sessions[session] = state.url
+        return state.url
+
+    def record_success(self, proxy, latency=None):
+        state = self.states.get(proxy)
+        if state:
+            state.record(True, latency)
+            state.consecutive_failures = 0
+
+    def record_failure(self, proxy):
+        state = self.states.get(proxy)
+        if state:
+            state.record(False)
+            state.failures += 1
+            state.consecutive_failures += 1
+            backoff = min(self.cooldown * 2 ** (state.consecutive_failures - 1), self.max_cooldown)
+            state.cooldown_until = time.time() + backoff
+
+    def record_ban(self, proxy):
+        state = self.states.get(proxy)
+        if state:
+            state.record(False)
+            state.bans += 1
+            state.cooldown_until = time.time() + self.ban_cooldown
+
+    def stats(self):
+        """Pool summary in crawl stats format."""
+        now = time.time()
+        stats = {
+            "proxy_pool/size": len(self.states),
+            "proxy_pool/available": len(self.available(now)),
+        }
+        for state in self.states.values():
+            prefix = f"proxy_pool/{state.label}"
+            stats[f"{prefix}/requests"] = state.requests
+            stats[f"{prefix}/failures"] = state.failures
+            stats[f"{prefix}/bans"] = state.bans
+            stats[f"{prefix}/success_rate"] = round(state.success_rate, 3)
+            if state.latency is not None:
+                stats[f"{prefix}/latency"] = round(state.latency, 3)
+        return stats
@@ -0,0 +1,287 @@
+# Schedulers with a crash-safe request queue for JOBDIR crawls and a shared
+# queue for crawls spread over several worker processes
+
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+from scrapy import signals
+from scrapy.core.scheduler import Scheduler
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.request import request_from_dict
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
+
+from trustpilot_scraper.sharedqueue import open_shared_queue
+from trustpilot_scraper.signals import checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_request(request, spider):
+    try:
+        return pickle.dumps(request.to_dict(spider=spider), protocol=4)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        # the scheduler falls back to the memory queue on ValueError
+        raise ValueError(str(e)) from e
+
+
+def deserialize_request(data, spider):
+    return request_from_dict(pickle.loads(data), spider=spider)
+
+
+class SqliteRequestQueue:
+    """Durable priority queue of serialized requests in a single SQLite file.
+
+    Every push and pop is committed right away. Popped requests carry their
+    row id in the "queue_row" meta key and stay in the table, marked in
+    flight, until the second checkpoint after their response arrived (or
+    their download failed, or they were dropped): the response still has to
+    go through its callback and the items through the pipelines before the
+    feeds are flushed. The queue is closed after the engine finished every
+    popped request, so the rows still in flight then, e.g. of requests a
+    downloader middleware ignored, are removed as well. Requests that were in
+    flight when the process died are queued again on resume, so a killed
+    crawl repeats at most two checkpoint intervals of work.
+    Within a priority the order is LIFO, like Scrapy's default disk queue.
+    """
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS requests ("
+            " id INTEGER PRIMARY KEY,"
+            " priority INTEGER NOT NULL,"
+            " data BLOB NOT NULL,"
+            " in_flight INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS requests_next ON requests (in_flight, priority, id)")
+
+        requeued = self.conn.execute("UPDATE requests SET in_flight = 0 WHERE in_flight = 1").rowcount
+        if requeued:
+            logger.info(f"Re-queued {requeued} requests that were in flight when the previous run stopped")
+        self.size = self.conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+        self.in_flight = set()
+        self.done = []
+        self.done_before = []
+
+        crawler.signals.connect(self.request_done, signal=signals.response_received)
+        crawler.signals.connect(self.request_done, signal=signals.request_left_downloader)
+        crawler.signals.connect(self.request_done, signal=signals.request_dropped)
+        crawler.signals.connect(self.checkpoint, signal=checkpoint)
+
+    def __len__(self):
+        return self.size
+
+    def push(self, request):
+        # retries and redirects are copies of a popped request, they get a row of their own
+        request.meta.pop("queue_row", None)
+        data = serialize_request(request, self.crawler.spider)
+        self.conn.execute("INSERT INTO requests (priority, data) VALUES (?, ?)", (request.priority, data))
+        self.size += 1
+
+    def pop(self):
+        row = self.conn.execute(
+            "SELECT id, data FROM requests WHERE in_flight = 0 ORDER BY priority DESC, id DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        row_id, data = row
+        self.conn.execute("UPDATE requests SET in_flight = 1 WHERE id = ?", (row_id,))
+        self.size -= 1
+
+        request = deserialize_request(data, self.crawler.spider)
+        request.meta["queue_row"] = row_id
+        self.in_flight.add(row_id)
+        return request
+
+    def request_done(self, request, **kwargs):
+        row_id = request.meta.get("queue_row")
+        if row_id in self.in_flight:
+            self.in_flight.remove(row_id)
+            self.done.append(row_id)
+
+    def checkpoint(self, final=False):
+        # rows finished before the previous checkpoint have been fully processed by now
+        finished = self.done_before + self.done if final else self.done_before
+        if finished:
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany("DELETE FROM requests WHERE id = ?", [(row_id,) for row_id in finished])
+        self.done_before, self.done = ([], []) if final else (self.done, [])
+
+    def close(self):
+        self.crawler.signals.disconnect(self.request_done, signal=signals.response_received)
+        self.crawler.signals.disconnect(self.request_done, signal=signals.request_left_downloader)
+        self.crawler.signals.disconnect(self.request_done, signal=signals.request_dropped)
+        self.crawler.signals.disconnect(self.checkpoint, signal=checkpoint)
+        # no popped request is in progress any more
+        self.done.extend(self.in_flight)
+        self.in_flight.clear()
+        self.checkpoint(final=True)
+        self.conn.close()
+        # priorities are stored per row, there is no active.json state to keep
+        return []
+
+
+class ResumableScheduler(Scheduler):
+    """Scrapy's scheduler with the JOBDIR disk queue replaced by SqliteRequestQueue.
+
+    The stock disk queues only write their headers on a clean shutdown, so a
+    crawl that is killed cannot be resumed. Without JOBDIR this behaves
+    exactly like the default scheduler.
+    """
+
+    def _dq(self):
+        queue = SqliteRequestQueue(self.crawler, os.path.join(self.dqdir, "requests.sqlite"))
+        if queue:
+            logger.info(f"Resuming crawl ({len(queue)} requests scheduled)")
+        return queue
+
+
+class SharedRequestQueue:
+    """Scheduler disk queue interface on top of a shared queue backend."""
+
+    def __init__(self, crawler, backend):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.backend = backend
+
+    def __len__(self):
+        return len(self.backend)
+
+    def push(self, request):
+        self.backend.push(request.priority, serialize_request(request, self.crawler.spider))
+        self.stats.inc_value("shared_queue/pushed")
+
+    def pop(self):
+        data = self.backend.pop()
+        if data is None:
+            return None
+        self.stats.inc_value("shared_queue/popped")
+        return deserialize_request(data, self.crawler.spider)
+
+    def close(self):
+        self.backend.close()
+        return []
+
+
+class SharedDupeFilter(BaseDupeFilter):
+    """Request fingerprints are checked against the seen set of the shared queue."""
+
+    def __init__(self, backend, crawler):
+        self.backend = backend
+        self.fingerprinter = crawler.request_fingerprinter
+        self.stats = crawler.stats
+
+    def request_seen(self, request):
+        return not self.backend.add_seen(self.fingerprinter.fingerprint(request).hex())
+
+    def log(self, request, spider):
+        logger.debug(f"Filtered duplicate request (shared queue): {request}")
+        self.stats.inc_value("shared_queue/filtered")
+
+
+class SharedQueueScheduler(ResumableScheduler):
+    """Pulls requests from and pushes requests to a queue shared by several worker processes.
+
+    With SHARED_QUEUE_URI set, every scheduled request goes to the shared
+    queue (memory://, sqlite:///path or redis://host:port/db) named by
+    SHARED_QUEUE_KEY, and duplicates are filtered against the queue's shared
+    seen set, so any number of workers started with the same spider
+    arguments cooperate on one crawl: the first one seeds the categories
+    page (the spider sends the seed request through the shared seen set),
+    the others pick up the subcategory and profile requests it discovers. A
+    worker stops once the shared queue has been empty for
+    SHARED_QUEUE_IDLE_TIMEOUT seconds while it had nothing left to do.
+
+    The shared queue takes the place of the JOBDIR request queue. Requests
+    a worker has popped are lost if that worker is killed. Without
+    SHARED_QUEUE_URI this is ResumableScheduler.
+    """
+
+    shared = None
+    poller = None
+    polled = None
+
+    def open(self, spider):
+        settings = self.crawler.settings
+        uri = settings.get("SHARED_QUEUE_URI")
+        if not uri:
+            return super().open(spider)
+
+        key = settings.get("SHARED_QUEUE_KEY") % {"spider": spider.name, **getattr(spider, "job_args", {})}
+        self.shared = open_shared_queue(uri, key)
+        self.idle_timeout = settings.getfloat("SHARED_QUEUE_IDLE_TIMEOUT")
+        self.idle_since = None
+        if not len(self.shared) and self.shared.seen_count():
+            logger.warning(f"Shared queue {key!r} is empty but has {self.shared.seen_count()} seen requests. "
+                           f"If that crawl is finished, use a new SHARED_QUEUE_KEY to crawl again")
+        logger.info(f"Using shared request queue {key!r} ({len(self.shared)} requests queued)")
+
+        self.dqdir = None
+        self.df = SharedDupeFilter(self.shared, self.crawler)
+        result = super().open(spider)
+        self.dqs = SharedRequestQueue(self.crawler, self.shared)
+        # the engine only looks at an idle scheduler every 5 seconds, waiting
+        # workers check the shared queue more often
+        self.poller = LoopingCall(self.poll)
+        self.poller.start(settings.getfloat("SHARED_QUEUE_POLL_INTERVAL"), now=False)
+        return result
+
+    def poll(self):
+        engine = self.crawler.engine
+        if self.idle_since is None or engine.needs_backout():
+            return
+        request = self.dqs.pop()
+        if request is not None:
+            # engine.crawl() wakes the engine up, enqueue_request keeps the
+            # request local instead of filtering it as seen
+            self.polled = request
+            engine.crawl(request)
+        elif engine.spider_is_idle():
+            # the idle timeout is over, close now instead of at the engine's next heartbeat
+            results = self.crawler.signals.send_catch_log(
+                signals.spider_idle, spider=self.crawler.spider, dont_log=DontCloseSpider
+            )
+            if not any(isinstance(result, Failure) and isinstance(result.value, DontCloseSpider)
+                       for _, result in results):
+                engine.close_spider(self.crawler.spider, "finished")
+
+    def enqueue_request(self, request):
+        if request is self.polled:
+            self.polled = None
+            self.mqs.push(request)
+            return True
+        return super().enqueue_request(request)
+
+    def next_request(self):
+        request = super().next_request()
+        if request is not None and self.shared is not None:
+            self.idle_since = None
+        return request
+
+    def has_pending_requests(self):
+        if self.shared is None:
+            return super().has_pending_requests()
+        # only asked while this worker has nothing to download or process
+        if len(self):
+            return True
+        now = time.monotonic()
+        if self.idle_since is None:
+            self.idle_since = now
+        return now - self.idle_since < self.idle_timeout
+
+    def close(self, reason):
+        if self.shared is None:
+            return super().close(reason)
+        if self.poller.running:
+            self.poller.stop()
+        self.dqs.close()
+        return self.df.close(reason)
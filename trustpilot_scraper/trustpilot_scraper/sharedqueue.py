@@ -0,0 +1,152 @@
+# Shared request queue backends for SharedQueueScheduler
+#
+# All backends share the same small interface: `push(priority, data)`,
+# `pop()` (serialized request or None), `len(backend)`, `add_seen(key)`
+# (returns True if the fingerprint was new), `seen_count()` and `close()`.
+# Within a priority the order is LIFO, like Scrapy's default queues.
+
+import os
+import sqlite3
+import time
+
+
+class MemorySharedQueue:
+    """In-process backend, shared by all crawlers of one process that use the same key."""
+
+    _queues = {}
+
+    def __init__(self, key):
+        self.key = key
+        if key not in self._queues:
+            self._queues[key] = ({}, set())
+        # priority -> list of serialized requests, seen fingerprints
+        self.queues, self.seen = self._queues[key]
+
+    def push(self, priority, data):
+        self.queues.setdefault(priority, []).append(data)
+
+    def pop(self):
+        if not self.queues:
+            return None
+        priority = max(self.queues)
+        queue = self.queues[priority]
+        data = queue.pop()
+        if not queue:
+            del self.queues[priority]
+        return data
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def add_seen(self, key):
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+    def seen_count(self):
+        return len(self.seen)
+
+    def close(self):
+        pass
+
+
+class SqliteSharedQueue:
+    """SQLite backend for worker processes on one machine.
+
+    Pops are a single DELETE ... RETURNING statement, so no two processes
+    ever get the same request.
+    """
+
+    def __init__(self, path, key):
+        self.key = key
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_requests ("
+            " id INTEGER PRIMARY KEY,"
+            " queue TEXT NOT NULL,"
+            " priority INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS shared_requests_next ON shared_requests (queue, priority, id)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_seen (queue TEXT NOT NULL, key TEXT NOT NULL,"
+            " PRIMARY KEY (queue, key)) WITHOUT ROWID"
+        )
+
+    def push(self, priority, data):
+        self.conn.execute("INSERT INTO shared_requests (queue, priority, data) VALUES (?, ?, ?)",
+                          (self.key, priority, data))
+
+    def pop(self):
+        row = self.conn.execute(
+            "DELETE FROM shared_requests WHERE id = ("
+            " SELECT id FROM shared_requests WHERE queue = ? ORDER BY priority DESC, id DESC LIMIT 1"
+            ") RETURNING data",
+            (self.key,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM shared_requests WHERE queue = ?", (self.key,)).fetchone()[0]
+
+    def add_seen(self, key):
+        return self.conn.execute("INSERT OR IGNORE INTO shared_seen (queue, key) VALUES (?, ?)",
+                                 (self.key, key)).rowcount == 1
+
+    def seen_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM shared_seen WHERE queue = ?", (self.key,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class RedisSharedQueue:
+    """Redis backend for worker nodes on several machines, needs the optional redis dependency.
+
+    Requests live in the sorted set `<key>:requests` scored by priority.
+    Every member starts with a timestamp so that ZPOPMAX returns the newest
+    request of the highest priority. Fingerprints go to the set `<key>:seen`.
+    """
+
+    def __init__(self, url, key):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.requests_key = f"{key}:requests"
+        self.seen_key = f"{key}:seen"
+
+    def push(self, priority, data):
+        # 8 byte timestamp + 4 random bytes keep equal requests apart
+        member = time.time_ns().to_bytes(8, "big") + os.urandom(4) + data
+        self.client.zadd(self.requests_key, {member: priority})
+
+    def pop(self):
+        # with a count the reply is a list of (member, score) pairs on both RESP2 and RESP3
+        popped = self.client.zpopmax(self.requests_key, 1)
+        return popped[0][0][12:] if popped else None
+
+    def __len__(self):
+        return self.client.zcard(self.requests_key)
+
+    def add_seen(self, key):
+        return self.client.sadd(self.seen_key, key) == 1
+
+    def seen_count(self):
+        return self.client.scard(self.seen_key)
+
+    def close(self):
+        self.client.close()
+
+
+def open_shared_queue(uri, key):
+    """Opens the backend for a memory://, sqlite:///path or redis://... URI."""
+    if uri.startswith("memory://"):
+        return MemorySharedQueue(key)
+    if uri.startswith("sqlite:///"):
+        return SqliteSharedQueue(uri[len("sqlite:///"):], key)
+    if uri.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedQueue(uri, key)
+    raise ValueError(f"Unsupported shared queue URI {uri!r}, expected memory://, sqlite:///path or redis://...")
@@ -0,0 +1,9 @@
+# Custom signals sent between the project's extensions, middlewares and pipelines
+
+# Sent every CHECKPOINT_INTERVAL seconds on JOBDIR crawls; stateful
+# components save their state to the job directory when they receive it
+checkpoint = object()
+
+# Sent by BlockDetectionMiddleware when a response is a ban or captcha page,
+# with the arguments request, response, kind ("blocked" or "captcha") and spider
+response_blocked = object()
@@ -0,0 +1,367 @@
+# Persistent stores used across crawl runs
+
+import hashlib
+import json
+import sqlite3
+import time
+
+
+# Fields that depend on the listing a profile was reached from, not on the profile itself;
+# listed_in also depends on which listings were visited before the profile
+VOLATILE_FIELDS = ("category", "subcategory", "listed_in")
+
+
+def item_fingerprint(item):
+    """Content hash of an item, ignoring the fields that vary per listing."""
+    data = {key: value for key, value in dict(item).items() if key not in VOLATILE_FIELDS}
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    """SQLite store holding a content hash and last-seen timestamp per company URL.
+
+    The parallel crawls of main.py open the same file, so every write is
+    committed at once instead of holding the write lock for a batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " url TEXT PRIMARY KEY,"
+            " content_hash TEXT NOT NULL,"
+            " last_seen REAL NOT NULL)"
+        )
+
+    def get(self, url):
+        """Returns (content_hash, last_seen) for the URL, or None if never seen."""
+        return self.conn.execute(
+            "SELECT content_hash, last_seen FROM fingerprints WHERE url = ?", (url,)
+        ).fetchone()
+
+    def seen_since(self, url, since):
+        row = self.conn.execute(
+            "SELECT 1 FROM fingerprints WHERE url = ? AND last_seen >= ?", (url, since)
+        ).fetchone()
+        return row is not None
+
+    def update(self, url, content_hash, last_seen=None):
+        self.conn.execute(
+            "INSERT INTO fingerprints (url, content_hash, last_seen) VALUES (?, ?, ?)"
+            " ON CONFLICT(url) DO UPDATE SET content_hash = excluded.content_hash, last_seen = excluded.last_seen",
+            (url, content_hash, last_seen or time.time()),
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+class SeenUrlStore:
+    """Compact SQLite set of company URLs plus the listings each one was found in.
+
+    Pass ":memory:" as path to keep the set for the current run only. A file
+    can be shared by parallel crawls, so every write is committed at once.
+    Every URL and listing carries the time it was last seen, and lookups take
+    a `since` timestamp so entries of earlier runs expire.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_urls ("
+            " url TEXT PRIMARY KEY,"
+            " seen_at REAL NOT NULL,"
+            " emitted_at REAL) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS memberships ("
+            " url TEXT NOT NULL,"
+            " category TEXT NOT NULL,"
+            " subcategory TEXT NOT NULL,"
+            " seen_at REAL NOT NULL,"
+            " PRIMARY KEY (url, category, subcategory)) WITHOUT ROWID"
+        )
+
+    def add(self, url, since=0):
+        """Adds the URL and returns True if it was not in the set, or not seen since `since`."""
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT INTO seen_urls (url, seen_at) VALUES (?, ?)"
+            " ON CONFLICT(url) DO UPDATE SET seen_at = excluded.seen_at, emitted_at = NULL"
+            " WHERE seen_at < ?",
+            (url, now, since),
+        )
+        return cursor.rowcount == 1
+
+    def __contains__(self, url):
+        return self.conn.execute("SELECT 1 FROM seen_urls WHERE url = ?", (url,)).fetchone() is not None
+
+    def mark_emitted(self, url):
+        """Records that the URL's item was passed on."""
+        self.conn.execute("UPDATE seen_urls SET emitted_at = ? WHERE url = ?", (time.time(), url))
+
+    def emitted_since(self, url, since=0):
+        row = self.conn.execute(
+            "SELECT 1 FROM seen_urls WHERE url = ? AND emitted_at >= ?", (url, since)
+        ).fetchone()
+        return row is not None
+
+    def add_membership(self, url, category, subcategory, since=0):
+        """Records a listing of the URL and returns True if it was not recorded since `since`."""
+        cursor = self.conn.execute(
+            "INSERT INTO memberships (url, category, subcategory, seen_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(url, category, subcategory) DO UPDATE SET seen_at = excluded.seen_at"
+            " WHERE seen_at < ?",
+            (url, category or "", subcategory or "", time.time(), since),
+        )
+        return cursor.rowcount == 1
+
+    def memberships(self, url, since=0):
+        """Returns the (category, subcategory) pairs the URL was listed under since `since`."""
+        return self.conn.execute(
+            "SELECT category, subcategory FROM memberships WHERE url = ? AND seen_at >= ?"
+            " ORDER BY category, subcategory",
+            (url, since),
+        ).fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+class DiscoveryCache:
+    """SQLite cache of the category tree and of the company URLs listed in each subcategory, per country.
+
+    The tree is a list of (category name, [subcategory links]) pairs as found
+    on the categories page. Company lists are stored as profile paths, so
+    they do not depend on the host the crawl ran against.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS category_trees ("
+            " country TEXT PRIMARY KEY,"
+            " tree TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS subcategory_companies ("
+            " country TEXT NOT NULL,"
+            " subcategory TEXT NOT NULL,"
+            " companies TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (country, subcategory)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def tree(self, country, max_age):
+        """The cached tree, or None if there is none younger than max_age seconds."""
+        row = self.conn.execute(
+            "SELECT tree FROM category_trees WHERE country = ? AND fetched_at >= ?", (country, time.time() - max_age)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_tree(self, country, tree):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO category_trees (country, tree, fetched_at) VALUES (?, ?, ?)",
+            (country, json.dumps(tree), time.time()),
+        )
+        self.conn.commit()
+
+    def companies(self, country, subcategory, max_age):
+        """The cached profile paths of a subcategory, or None if there are none younger than max_age seconds."""
+        row = self.conn.execute(
+            "SELECT companies FROM subcategory_companies WHERE country = ? AND subcategory = ? AND fetched_at >= ?",
+            (country, subcategory, time.time() - max_age),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_companies(self, country, subcategory, paths):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO subcategory_companies (country, subcategory, companies, fetched_at)"
+            " VALUES (?, ?, ?, ?)",
+            (country, subcategory, json.dumps(paths), time.time()),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class ReviewWatermarkStore:
+    """SQLite store of the publication date of the newest review crawled per company URL."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS review_watermarks ("
+            " url TEXT PRIMARY KEY,"
+            " newest_review TEXT NOT NULL) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    def get(self, url):
+        row = self.conn.execute("SELECT newest_review FROM review_watermarks WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, url, newest_review):
+        # ISO 8601 timestamps compare as strings
+        self.conn.execute(
+            "INSERT INTO review_watermarks (url, newest_review) VALUES (?, ?)"
+            " ON CONFLICT (url) DO UPDATE SET newest_review = MAX(newest_review, excluded.newest_review)",
+            (url, newest_review),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+# Columns of the companies table, besides trustpilot_url and the first/last seen timestamps
+COMPANY_COLUMNS = (
+    "company_name", "country", "category", "subcategory", "avg_review_score", "review_count",
+    "website", "email", "phone", "address", "listed_in",
+)
+# Changes of these columns are recorded in company_history
+HISTORY_COLUMNS = ("avg_review_score", "review_count")
+
+
+class CompanySink:
+    """Upserts batches of company rows, keyed on trustpilot_url, and records score/count history.
+
+    Rows are dicts with trustpilot_url, COMPANY_COLUMNS and seen_at, or
+    with trustpilot_url and listed_in only to update the listings of a
+    company that was written before. The
+    sink is not thread safe, but the connection may be used from any single
+    thread at a time. Subclasses provide the connection and SQL dialect.
+    """
+
+    placeholder = "?"
+    real_type = "REAL"
+    key_type = "TEXT"
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.create_tables()
+
+    def create_tables(self):
+        columns = ", ".join(
+            f"{column} {self.real_type if column == 'avg_review_score' else 'BIGINT' if column == 'review_count' else 'TEXT'}"
+            for column in COMPANY_COLUMNS
+        )
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS companies ("
+            f" trustpilot_url {self.key_type} PRIMARY KEY, {columns},"
+            f" first_seen {self.real_type} NOT NULL, last_seen {self.real_type} NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS company_history ("
+            f" trustpilot_url {self.key_type} NOT NULL,"
+            f" avg_review_score {self.real_type}, review_count BIGINT,"
+            f" observed_at {self.real_type} NOT NULL)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS company_history_url ON company_history (trustpilot_url, observed_at)"
+        )
+        self.conn.commit()
+
+    def current_values(self, cursor, urls):
+        """Stored (avg_review_score, review_count) per URL, in chunks to stay below parameter limits."""
+        current = {}
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            params = ", ".join([self.placeholder] * len(chunk))
+            cursor.execute(
+                f"SELECT trustpilot_url, {', '.join(HISTORY_COLUMNS)} FROM companies"
+                f" WHERE trustpilot_url IN ({params})",
+                chunk,
+            )
+            current.update((row[0], tuple(row[1:])) for row in cursor.fetchall())
+        return current
+
+    def write(self, rows):
+        """Upserts one batch in a single transaction, returns the number of history rows added."""
+        listings = [(row["listed_in"], row["trustpilot_url"]) for row in rows if "seen_at" not in row]
+        # the last row of a URL wins within a batch
+        rows = list({row["trustpilot_url"]: row for row in rows if "seen_at" in row}.values())
+        p = self.placeholder
+        columns = ("trustpilot_url",) + COMPANY_COLUMNS
+        upsert = (
+            f"INSERT INTO companies ({', '.join(columns)}, first_seen, last_seen)"
+            f" VALUES ({', '.join([p] * (len(columns) + 2))})"
+            f" ON CONFLICT (trustpilot_url) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in COMPANY_COLUMNS)
+            + ", last_seen = excluded.last_seen"
+        )
+
+        cursor = self.conn.cursor()
+        try:
+            current = self.current_values(cursor, [row["trustpilot_url"] for row in rows])
+            history = [
+                (row["trustpilot_url"], *(row[column] for column in HISTORY_COLUMNS), row["seen_at"])
+                for row in rows
+                if current.get(row["trustpilot_url"]) != tuple(row[column] for column in HISTORY_COLUMNS)
+            ]
+            cursor.executemany(
+                upsert,
+                [tuple(row[column] for column in columns) + (row["seen_at"], row["seen_at"]) for row in rows],
+            )
+            if history:
+                cursor.executemany(
+                    f"INSERT INTO company_history (trustpilot_url, {', '.join(HISTORY_COLUMNS)}, observed_at)"
+                    f" VALUES ({p}, {p}, {p}, {p})",
+                    history,
+                )
+            if listings:
+                # after the upserts, the company may be in this batch
+                cursor.executemany(f"UPDATE companies SET listed_in = {p} WHERE trustpilot_url = {p}", listings)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return len(history)
+
+    def close(self):
+        self.conn.close()
+
+
+class SqliteCompanySink(CompanySink):
+
+    def __init__(self, path):
+        conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        super().__init__(conn)
+
+
+class PostgresCompanySink(CompanySink):
+    """PostgreSQL target, needs the optional psycopg dependency."""
+
+    placeholder = "%s"
+    real_type = "DOUBLE PRECISION"
+
+    def __init__(self, dsn):
+        import psycopg
+
+        super().__init__(psycopg.connect(dsn))
+
+
+def open_company_sink(uri):
+    """Opens the sink for a sqlite:///path or postgresql://... URI."""
+    if uri.startswith(("postgres://", "postgresql://")):
+        return PostgresCompanySink(uri)
+    if uri.startswith("sqlite:///"):
+        return SqliteCompanySink(uri[len("sqlite:///"):])
+    raise ValueError(f"Unsupported database URI {uri!r}, expected sqlite:///path or postgresql://...")
@@ -0,0 +1,105 @@
+# Helpers shared by the spider, middlewares and pipelines
+
+import os
+import pickle
+import zlib
+from urllib.parse import urlparse, urlunparse
+
+from scrapy.utils.job import job_dir
+
+CANONICAL_HOST = "www.trustpilot.com"
+
+
+def normalize_company_url(url):
+    """Returns the canonical form of a Trustpilot company profile URL.
+
+    Query strings, fragments and trailing slashes are dropped, and locale
+    hosts (de.trustpilot.com, uk.trustpilot.com, ...) map to www.trustpilot.com.
+    """
+    if not url:
+        return None
+
+    parsed = urlparse(url.strip())
+    host = parsed.netloc.lower()
+    if host == "trustpilot.com" or host.endswith(".trustpilot.com"):
+        host = CANONICAL_HOST
+
+    path = parsed.path.rstrip("/")
+    if path.startswith("/review/"):
+        # /review/<domain>/... -> /review/<domain>
+        path = "/review/" + path[len("/review/"):].split("/")[0].lower()
+    return urlunparse((parsed.scheme.lower() or "https", host, path, "", "", ""))
+
+
+def is_company_url(url):
+    """Checks whether the URL points to a company profile (/review/<domain>)."""
+    return urlparse(url).path.startswith("/review/")
+
+
+def url_kind(url):
+    """Page type of a Trustpilot URL: "profile", "category" (index and listings) or "default"."""
+    path = urlparse(url).path
+    if path.startswith("/review/"):
+        return "profile"
+    if path.rstrip("/") == "/categories" or path.startswith("/categories/"):
+        return "category"
+    return "default"
+
+
+def to_int(value):
+    """review_count as scraped ("1234", "1,234") to int, None if missing or malformed."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def to_float(value):
+    """avg_review_score as scraped ("4.5", "4,5") to float, None if missing or malformed."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(str(value).replace(",", ".").strip())
+    except ValueError:
+        return None
+
+
+def parse_shard(value):
+    """Parses a `k/N` shard argument into (k, N), with 0 <= k < N."""
+    index, sep, count = str(value).partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError(f"Invalid shard {value!r}, expected k/N, e.g. 3/8") from None
+    if not sep or count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}, expected k/N with 0 <= k < N")
+    return index, count
+
+
+def shard_of(key, count):
+    """Stable shard number of `key`; crc32 gives the same result in every process."""
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def write_state(path, data):
+    """Pickles crawl state to `path`, atomically replacing the previous file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(data, f, protocol=4)
+    os.replace(tmp_path, path)
+
+
+def read_state(path, default=None):
+    """Loads state written by write_state(), or returns `default` if there is none."""
+    if not path or not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def state_path(settings, name):
+    """Path of a state file inside JOBDIR, or None when the crawl is not resumable."""
+    jobdir = job_dir(settings)
+    return os.path.join(jobdir, name) if jobdir else None